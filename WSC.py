@@ -16,7 +16,7 @@ as well as detailed information.
 
 """
 
-from charles.charles import Population
+from charles.parallel import run_tasks, run_ga
 from charles.selection import tournament_selection
 from charles.crossover import eager_breeder_crossover
 from charles.mutation import dream_team
@@ -36,24 +36,31 @@ pop_size = 50
 nr_guests = 64
 nr_tables = 8
 
+# Parallel execution (None uses all CPUs)
+n_workers = None
+seed = 0
+
 
 def run_GA(selection_method, crossover_method, mutation_method, elitism):
     """
     Runs the GA with the given hyperparameters for 30 runs and saves the best
     individual found in the last generation among the runs.
+
+    The runs are independent and are executed in parallel, each one with
+    its own seed.
     """
 
     best_fitness = 0
     best_individual = None
 
-    for _ in range(nr_runs):
-
-        pop = Population(pop_size = pop_size, nr_guests = nr_guests, nr_tables = nr_tables)
+    tasks = [(run_nr, dict(pop_size = pop_size, nr_guests = nr_guests, nr_tables = nr_tables,
+                           n_generations = n_generations, xo_prob = xo_prob,
+                           mut_prob = mut_prob, select = selection_method,
+                           mutate = mutation_method, crossover = crossover_method,
+                           elitism = elitism, elite_size = elite_size))
+             for run_nr in range(nr_runs)]
 
-        _, ind = pop.evolve(n_generations = n_generations, xo_prob = xo_prob,
-                                            mut_prob = mut_prob, select = selection_method,
-                                            mutate = mutation_method, crossover = crossover_method,
-                                            elitism = elitism, elite_size = elite_size)
+    for _, ind in run_tasks(run_ga, tasks, n_workers = n_workers, seed = seed):
         
         if ind.get_fitness() > best_fitness:
             best_fitness = ind.get_fitness()
@@ -71,4 +78,5 @@ def run_GA(selection_method, crossover_method, mutation_method, elitism):
 
 # -------- Run the GA with the best hyperparameters found in the Grid Search -------- #
 
-best_individual = run_GA(tournament_selection, eager_breeder_crossover, dream_team, True)
\ No newline at end of file
+if __name__ == '__main__':
+    best_individual = run_GA(tournament_selection, eager_breeder_crossover, dream_team, True)
@@ -0,0 +1,102 @@
+"""
+This file contains a benchmark of the copies made in one generation of
+Population.evolve, comparing copy.deepcopy with Individual.clone.
+
+In each generation the elite, the best individual and the parents that skip
+crossover are copied. With the default hyperparameters of the Grid Search
+(pop_size = 50, elite_size = 5, xo_prob = 0.9) that is around 11 copies.
+The benchmark also compares the table fitness computation that used to
+deep copy each table.
+
+Usage (from the project root):
+    python -m benchmarks.copy_benchmark
+"""
+
+import time
+import tracemalloc
+from copy import deepcopy
+
+from charles.charles import Population
+
+# ---------------------- Fixed Hyperparameters ---------------------- #
+pop_size = 50
+elite_size = 5
+xo_prob = 0.9
+nr_guests = 64
+nr_tables = 8
+repeats = 200
+
+
+def copies_per_generation():
+    """
+    Expected number of individuals copied in one generation
+    """
+    # Elite + best individual + parents of the pairs without crossover
+    return elite_size + 1 + round((1 - xo_prob) * pop_size)
+
+def measure(copy_function, individuals):
+    """
+    Time per generation and peak memory allocated while making the copies of one generation
+    """
+    nr_copies = copies_per_generation()
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        [copy_function(individuals[i % len(individuals)]) for i in range(nr_copies)]
+    elapsed = (time.perf_counter() - start) / repeats
+
+    tracemalloc.start()
+    copies = [copy_function(individuals[i % len(individuals)]) for i in range(nr_copies)]
+    _, allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del copies
+
+    return elapsed, allocated
+
+def deepcopy_table_fitness(individual, table_idx):
+    """
+    Previous table fitness computation, that deep copied the table
+    """
+    table_fitness = 0
+
+    table = deepcopy(individual[table_idx])
+
+    while len(table) > 1:
+        guest = table.pop()
+
+        for other_guest in table:
+            table_fitness += individual.problem.matrix[guest][other_guest]
+
+    return table_fitness
+
+def measure_fitness(table_fitness_function, individuals):
+    """
+    Time to compute the fitness of every table of the population
+    """
+    start = time.perf_counter()
+    for _ in range(repeats // 10):
+        for individual in individuals:
+            for table_idx in range(len(individual)):
+                table_fitness_function(individual, table_idx)
+
+    return (time.perf_counter() - start) / (repeats // 10)
+
+
+if __name__ == '__main__':
+    individuals = Population(pop_size = pop_size, nr_guests = nr_guests, nr_tables = nr_tables).get_individuals()
+
+    # Cache the fitness, as in evolve
+    for individual in individuals:
+        individual.get_fitness()
+
+    print(f'Copies per generation: {copies_per_generation()}')
+
+    for name, copy_function in [('deepcopy', deepcopy), ('clone', lambda individual: individual.clone())]:
+        elapsed, allocated = measure(copy_function, individuals)
+        print(f'{name:>10}: {elapsed * 1e3:8.3f} ms per generation, {allocated / 1024:8.1f} KiB peak allocation per generation')
+
+    for name, table_fitness_function in [('deepcopy', deepcopy_table_fitness),
+                                         ('copy-free', lambda individual, table_idx: individual._compute_table_fitness(table_idx))]:
+        elapsed = measure_fitness(table_fitness_function, individuals)
+        print(f'{name:>10}: {elapsed * 1e3:8.3f} ms to compute the table fitness of the population')
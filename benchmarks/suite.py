@@ -0,0 +1,236 @@
+"""
+This file contains the benchmark suite of the GA components: mutation and
+crossover operators, selection methods, population evaluation and a full
+generation of Population.evolve.
+
+Each component is run on synthetic problems of several sizes (64, 256, 1024
+and 4096 guests by default, with 8 guests per table). For each component and
+size the suite reports the median latency of a call and the peak memory
+allocated by one call (measured separately with tracemalloc).
+
+Results are saved as a JSON file named after the current git commit, so runs
+on different commits can be compared to catch regressions.
+
+Usage (from the project root):
+    python -m benchmarks.suite [--sizes 64 256] [--components dream_team evolve] [--output file.json]
+    python -m benchmarks.suite --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from copy import copy
+from statistics import median
+
+import numpy as np
+
+from charles.charles import Population, Individual, batch_fitness
+from charles.problem import SeatingProblem
+from charles.parallel import seed_rngs
+from charles.selection import tournament_selection, fps, ranking_selection
+from charles.crossover import gbx_crossover, eager_breeder_crossover, twin_maker
+from charles.mutation import swap_mutation, merge_and_split, the_hop, dream_team
+from charles.local_search import swap_local_search
+
+# ---------------------- Fixed Hyperparameters ---------------------- #
+sizes = [64, 256, 1024, 4096]
+guests_per_table = 8
+pop_size = 50
+elite_size = 5
+xo_prob = 0.9
+mut_prob = 0.1
+
+# Relationship values of the wedding data (see README) and their frequency among pairs of guests
+relationship_values = [5000, 2000, 1000, 900, 700, 500, 300, -1000]
+relationship_probs = [0.001, 0.004, 0.01, 0.005, 0.005, 0.01, 0.01, 0.005]
+
+# Minimum time spent measuring each component and maximum number of calls
+min_time = 0.5
+max_calls = 1000
+
+results_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Relative slowdown above which a component is reported as a regression
+regression_threshold = 0.1
+
+
+def synthetic_problem(nr_guests, seed = 0):
+    """
+    Random problem with nr_guests guests and tables of guests_per_table guests.
+    Most pairs of guests are strangers (0), as in the wedding data.
+    """
+    rng = np.random.default_rng(seed)
+
+    values = np.array([0] + relationship_values, dtype = np.int16)
+    probs = [1 - sum(relationship_probs)] + relationship_probs
+
+    matrix = np.triu(values[rng.choice(len(values), size = (nr_guests, nr_guests), p = probs)], 1)
+
+    return SeatingProblem(matrix + matrix.T, nr_guests // guests_per_table)
+
+def components(problem):
+    """
+    Components to benchmark. Each one is a (setup, call) pair: setup prepares the
+    arguments (not measured) and call runs the component once with them.
+    """
+    # Population built once per problem size. Each call receives copies of its
+    # individuals, with their fitness already computed
+    base = Population(pop_size = pop_size, problem = problem)
+    for individual in base:
+        individual.get_fitness()
+
+    def individual():
+        return base[0].clone()
+
+    def parents():
+        return base[0].clone(), base[1].clone()
+
+    def population():
+        pop = copy(base)
+        pop.individuals = [individual.clone() for individual in base]
+        return pop
+
+    def uncached_population():
+        return [Individual(individual.representation, problem) for individual in base]
+
+    def evolve(pop):
+        # One generation, without the progress message
+        pop.evolve(n_generations = 1, xo_prob = xo_prob, mut_prob = mut_prob, select = tournament_selection,
+                   mutate = dream_team, crossover = eager_breeder_crossover, elite_size = elite_size, verbose = False)
+
+    return {
+        'swap_mutation': (individual, swap_mutation),
+        'merge_and_split': (individual, merge_and_split),
+        'the_hop': (individual, the_hop),
+        'dream_team': (individual, dream_team),
+        'swap_local_search': (individual, swap_local_search),
+        'gbx_crossover': (parents, lambda p: gbx_crossover(*p)),
+        'eager_breeder_crossover': (parents, lambda p: eager_breeder_crossover(*p)),
+        'twin_maker': (parents, lambda p: twin_maker(*p)),
+        'tournament_selection': (population, tournament_selection),
+        'fps': (population, fps),
+        'ranking_selection': (population, ranking_selection),
+        'tournament_selection_batch': (population, lambda pop: tournament_selection.batch(pop.get_fitnesses(), 2 * pop_size)),
+        'batch_fitness': (uncached_population, batch_fitness),
+        'evolve': (population, evolve),
+    }
+
+def measure(setup, call):
+    """
+    Median latency of a call (in seconds) and peak memory allocated by one call (in bytes)
+    """
+    latencies = []
+
+    while len(latencies) < max_calls and (len(latencies) == 0 or sum(latencies) < min_time):
+        args = setup()
+
+        call_start = time.perf_counter()
+        call(args)
+        latencies.append(time.perf_counter() - call_start)
+
+    args = setup()
+
+    tracemalloc.start()
+    call(args)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return median(latencies), peak_memory, len(latencies)
+
+def git_commit():
+    """
+    Short hash of the current git commit
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True,
+                              text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_suite(sizes, names = None, seed = 0):
+    """
+    Run the benchmark of the given components (all by default) for each problem size
+
+    Returns:
+        results (dict): Metadata of the run and, for each size and component,
+            the median latency, the peak memory and the number of calls measured
+    """
+    results = {'commit': git_commit(), 'python': platform.python_version(), 'numpy': np.__version__,
+               'pop_size': pop_size, 'guests_per_table': guests_per_table, 'benchmarks': {}}
+
+    for nr_guests in sizes:
+        problem = synthetic_problem(nr_guests, seed)
+
+        for name, (setup, call) in components(problem).items():
+            if names is not None and name not in names:
+                continue
+
+            seed_rngs(seed)
+            latency, peak_memory, nr_calls = measure(setup, call)
+
+            results['benchmarks'][f'{name}[{nr_guests}]'] = {'latency': latency, 'peak_memory': peak_memory,
+                                                              'calls': nr_calls}
+
+            print(f'{name:>28} [{nr_guests:>5} guests]: {latency * 1e3:10.3f} ms  '
+                  f'{peak_memory / 1024:10.1f} KiB  ({nr_calls} calls)', flush = True)
+
+    return results
+
+def compare(old_path, new_path):
+    """
+    Print the change in latency and memory of each benchmark between two result files
+    and return the benchmarks that got slower by more than the regression threshold
+    """
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+
+    print(f'{old["commit"]} -> {new["commit"]}')
+
+    regressions = []
+
+    for name, new_result in new['benchmarks'].items():
+        if name not in old['benchmarks']:
+            continue
+
+        old_result = old['benchmarks'][name]
+
+        latency_change = new_result['latency'] / old_result['latency'] - 1
+        memory_change = new_result['peak_memory'] / max(old_result['peak_memory'], 1) - 1
+
+        flag = 'REGRESSION' if latency_change > regression_threshold else ''
+        if flag:
+            regressions.append(name)
+
+        print(f'{name:>36}: latency {latency_change:+8.1%}  memory {memory_change:+8.1%}  {flag}')
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark suite of the GA components')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = sizes, help = 'Numbers of guests')
+    parser.add_argument('--components', nargs = '+', default = None, help = 'Components to run (all by default)')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', default = None, help = 'Result file (benchmarks/results/<commit>.json by default)')
+    parser.add_argument('--compare', nargs = 2, metavar = ('OLD', 'NEW'), help = 'Compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare)
+        raise SystemExit(1 if regressions else 0)
+
+    results = run_suite(args.sizes, args.components, args.seed)
+
+    output = args.output or os.path.join(results_directory, f'{results["commit"]}.json')
+    os.makedirs(os.path.dirname(output), exist_ok = True)
+
+    with open(output, 'w') as file:
+        json.dump(results, file, indent = 2)
+
+    print(f'Results saved to {output}')
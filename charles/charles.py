@@ -4,18 +4,362 @@ import sys
 parent_folder = os.path.abspath(os.path.join(os.getcwd(), ".."))
 sys.path.append(parent_folder)
 
-from random import random, shuffle
-from copy import deepcopy
-from data import relationships
+from random import random, getstate, setstate
+from math import ceil
+import pickle
+import time
+import numpy as np
+from charles.problem import default_problem
+
+# Maximum number of cells of the arrays (table submatrices or pairs of guests) built
+# in a single batch by the vectorized evaluation
+BATCH_CELLS = 2 ** 22
+
+# When rejecting duplicate offspring, duplicates are accepted again after breeding
+# this many pairs of parents per individual of the population in a generation
+MAX_PAIRS_PER_OFFSPRING = 10
+
+
+def tables_to_assignment(tables, nr_guests = None):
+    """
+    Convert a list of tables (sets of guests) to the compact representation:
+    an array where position guest - 1 holds the index of the table of the guest.
+
+    Args:
+        tables (list of sets): Tables of an arrangement
+        nr_guests (int, optional): Number of guests. Inferred from the tables if not given.
+
+    Returns:
+        assignment (np.ndarray of int16): Guest to table assignment
+    """
+    if nr_guests is None:
+        nr_guests = sum(len(table) for table in tables)
+
+    assignment = np.full(nr_guests, -1, dtype = np.int16)
+
+    for table_idx, table in enumerate(tables):
+        guests = np.fromiter(table, dtype = np.int32, count = len(table))
+        assignment[guests - 1] = table_idx
+
+    return assignment
+
+def assignment_to_tables(assignment, nr_tables = None):
+    """
+    Convert a guest to table assignment to per-table arrays of guests.
+
+    Args:
+        assignment (np.ndarray): Guest to table assignment (see tables_to_assignment)
+        nr_tables (int, optional): Number of tables. Inferred from the assignment if not given.
+
+    Returns:
+        tables (list of np.ndarray of int32): Sorted guests seated at each table
+    """
+    assignment = np.asarray(assignment)
+
+    if nr_tables is None:
+        nr_tables = int(assignment.max()) + 1
+
+    # Guests grouped by table (stable sort keeps them in increasing order)
+    guests = np.argsort(assignment, kind = 'stable').astype(np.int32) + 1
+    table_sizes = np.bincount(assignment[assignment >= 0], minlength = nr_tables)
+
+    # Skip unseated guests, which come first after sorting
+    guests = guests[len(assignment) - table_sizes.sum():]
+
+    return np.split(guests, np.cumsum(table_sizes)[:-1])
+
+def canonical_assignments(assignments):
+    """
+    Canonical form of a stack of guest to table assignments.
+
+    Tables are relabeled by order of appearance (the table of guest 1 becomes table 0,
+    the next new table becomes table 1, ...), so two arrangements with the same tables
+    in a different order have the same canonical form. Guests inside a table have no order
+    in this representation, so the canonical form does not depend on them either.
+
+    Args:
+        assignments (np.ndarray): Matrix of guest to table assignments, one row per individual
+
+    Returns:
+        (np.ndarray of int16): Canonical assignments
+    """
+    assignments = np.atleast_2d(assignments)
+    nr_individuals, nr_guests = assignments.shape
+    nr_tables = int(assignments.max()) + 1
+
+    rows = np.arange(nr_individuals)[:, None]
+
+    # Position of the first guest seated at each table
+    first_guest = np.full((nr_individuals, nr_tables), nr_guests)
+    np.minimum.at(first_guest, (rows, assignments), np.arange(nr_guests))
+
+    # New label of each table: rank of its first guest
+    labels = np.argsort(np.argsort(first_guest, axis = 1), axis = 1).astype(np.int16)
+
+    return labels[rows, assignments]
+
+def random_assignments(nr_individuals, problem):
+    """
+    Random arrangements, generated as one matrix of permutations of the guests that are
+    split among the tables according to their capacities.
+
+    Returns:
+        (np.ndarray of int16): Matrix of guest to table assignments, one row per individual
+    """
+    # Each row is a random permutation of the guests (0-based)
+    permutations = np.argsort(np.random.random((nr_individuals, problem.nr_guests)), axis = 1)
+
+    # Table of each position of the permutation
+    position_tables = np.repeat(np.arange(problem.nr_tables, dtype = np.int16), problem.table_capacities)
+
+    assignments = np.empty((nr_individuals, problem.nr_guests), dtype = np.int16)
+    np.put_along_axis(assignments, permutations, np.broadcast_to(position_tables, permutations.shape), axis = 1)
+
+    return assignments
+
+def greedy_assignment(problem):
+    """
+    Heuristic arrangement: each table is started with a random guest and filled,
+    one guest at a time, with the guest not yet seated that has the strongest
+    relationships with the guests already at the table (ties broken at random).
+
+    Returns:
+        (np.ndarray of int16): Guest to table assignment
+    """
+    assignment = np.full(problem.nr_guests, -1, dtype = np.int16)
+
+    # Random tie-breaking, smaller than any difference between relationships
+    noise = np.random.random(problem.nr_guests)
+
+    for table_idx in np.random.permutation(problem.nr_tables):
+        not_seated = assignment < 0
+
+        # Start the table with a random guest
+        guest = np.random.choice(np.flatnonzero(not_seated))
+
+        assignment[guest] = table_idx
+
+        # Sum of the relationships of each guest with the guests at the table
+        affinity = np.zeros(problem.nr_guests, dtype = np.int64)
+        other_guests, values = problem.neighbors(guest + 1)
+        affinity[other_guests - 1] += values
+
+        for _ in range(problem.table_capacities[table_idx] - 1):
+            not_seated = assignment < 0
+
+            # Guest with the strongest relationships with the table
+            guest = np.argmax(np.where(not_seated, affinity + noise, -np.inf))
+
+            assignment[guest] = table_idx
+            other_guests, values = problem.neighbors(guest + 1)
+            affinity[other_guests - 1] += values
+
+    return assignment
+
+def batch_table_fitness(assignments, problem):
+    """
+    Vectorized table fitness of a stack of individuals.
+
+    The guests of each assignment are grouped by table with a stable argsort into an
+    (individuals, tables, seats) array, and the fitness of each table is half the sum
+    of the relationship submatrix of its guests. The work is proportional to
+    nr_guests x seats per individual. Individuals are processed in chunks to bound
+    the memory used by the submatrices.
+
+    Problems with sparse relationships are evaluated from their pairs of guests
+    instead (see _edge_table_fitness).
+
+    Args:
+        assignments (np.ndarray): Matrix of guest to table assignments, one row per individual
+        problem (SeatingProblem): Problem the individuals belong to
+
+    Returns:
+        table_fitness (np.ndarray of int64): Fitness of each table of each individual
+    """
+    if problem.sparse:
+        return _edge_table_fitness(assignments, problem)
+
+    nr_individuals = len(assignments)
+
+    nr_tables = problem.nr_tables
+
+    table_fitness = np.empty((nr_individuals, nr_tables), dtype = np.int64)
+
+    if nr_individuals == 0:
+        return table_fitness
+
+    # Guest numbers of each seat of each table: (individuals, tables, seats), 0 for empty seats
+    tables = _group_by_table(assignments, nr_tables)
+
+    chunk_size = max(1, BATCH_CELLS // (nr_tables * tables.shape[2] ** 2))
+
+    for start in range(0, nr_individuals, chunk_size):
+        chunk = tables[start:start + chunk_size]
+
+        # Relationships among the guests of each table (row and column 0 of the matrix are zeros)
+        relationships = problem.matrix[chunk[..., :, None], chunk[..., None, :]]
+
+        # Each pair is counted twice, once for each guest
+        table_fitness[start:start + chunk_size] = relationships.sum(axis = (2, 3), dtype = np.int64) // 2
+
+    return table_fitness
+
+def _group_by_table(assignments, nr_tables):
+    """
+    Guests of each table of a stack of assignments
+
+    Returns:
+        tables (np.ndarray of intp): Array of shape (individuals, tables, seats) with the
+            guest numbers of each table in increasing order, 0 for the empty seats
+    """
+    nr_individuals, nr_guests = assignments.shape
+
+    # Table of each guest, shifted so that unseated guests (-1) are in table 0
+    shifted = assignments.astype(np.intp) + 1
+
+    # Guests sorted by table (stable, so in increasing order within each table)
+    order = np.argsort(shifted, axis = 1, kind = 'stable')
+    sorted_tables = np.take_along_axis(shifted, order, axis = 1)
+
+    # Number of guests of each table and position of the first one in the sorted order
+    rows = np.arange(nr_individuals)[:, None]
+    table_sizes = np.bincount((rows * (nr_tables + 1) + shifted).ravel(),
+                              minlength = nr_individuals * (nr_tables + 1)).reshape(nr_individuals, nr_tables + 1)
+    table_starts = np.cumsum(table_sizes, axis = 1) - table_sizes
+
+    # Seat of each guest in its table
+    seats = np.arange(nr_guests) - np.take_along_axis(table_starts, sorted_tables, axis = 1)
+
+    seated = sorted_tables > 0
+
+    tables = np.zeros((nr_individuals, nr_tables, max(1, int(table_sizes[:, 1:].max()))), dtype = np.intp)
+    tables[np.broadcast_to(rows, seated.shape)[seated], sorted_tables[seated] - 1, seats[seated]] = order[seated] + 1
+
+    return tables
+
+def _edge_table_fitness(assignments, problem):
+    """
+    Table fitness of a stack of individuals of a problem with sparse relationships.
+
+    Each pair of guests with a relationship adds its value to the fitness of the
+    table where both guests are seated, if they are at the same table. The work is
+    proportional to the number of pairs with a relationship.
+    """
+    nr_individuals = len(assignments)
+
+    nr_tables = problem.nr_tables
+
+    table_fitness = np.empty((nr_individuals, nr_tables), dtype = np.int64)
+
+    chunk_size = max(1, BATCH_CELLS // max(1, len(problem.edge_values)))
+
+    for start in range(0, nr_individuals, chunk_size):
+        chunk = assignments[start:start + chunk_size]
+
+        # Tables of the two guests of each pair: (individuals, pairs)
+        tables = chunk[:, problem.edge_guests - 1].astype(np.int64)
+        same_table = tables == chunk[:, problem.edge_other_guests - 1]
+
+        # Sum of the pairs seated together, by individual and table
+        bins = (np.arange(len(chunk))[:, None] * nr_tables + tables)[same_table]
+        weights = np.broadcast_to(problem.edge_values, tables.shape)[same_table]
+
+        sums = np.bincount(bins, weights = weights, minlength = len(chunk) * nr_tables)
+
+        table_fitness[start:start + chunk_size] = np.rint(sums).reshape(len(chunk), nr_tables)
+
+    return table_fitness
+
+def batch_fitness(individuals):
+    """
+    Fitness of a list of individuals.
+
+    Individuals with a cached fitness are not evaluated again. If the problem has a
+    fitness memo (see charles/memo.py), arrangements found in it are not evaluated
+    either and get the fitness of each of their tables from it. The remaining ones are evaluated together with batch_table_fitness, their
+    cache is filled and they are saved in the memo.
+
+    Args:
+        individuals (list of Individual): Individuals to evaluate, all of the same problem
+
+    Returns:
+        fitnesses (np.ndarray of int64): Fitness of each individual
+    """
+    fitnesses = np.empty(len(individuals), dtype = np.int64)
+
+    to_evaluate = []
+
+    for idx, individual in enumerate(individuals):
+        if individual._fitness is None:
+            to_evaluate.append(idx)
+        else:
+            fitnesses[idx] = individual._fitness
+
+    if len(to_evaluate) > 0:
+        problem = individuals[to_evaluate[0]].problem
+
+        assignments = np.stack([individuals[idx].to_assignment() for idx in to_evaluate])
+
+        if problem.memo is not None:
+            canonical = canonical_assignments(assignments)
+            keys = [row.tobytes() for row in canonical]
+
+            # Canonical label of each table of each arrangement, as the memo keeps the fitness
+            # of the tables in the order of their canonical labels. Tables without guests get
+            # the extra last label, whose fitness is 0
+            table_labels = np.full((len(to_evaluate), problem.nr_tables), problem.nr_tables, dtype = np.intp)
+            table_labels[np.arange(len(to_evaluate))[:, None], assignments] = canonical
+
+            # Arrangements already evaluated
+            misses = []
+            for position, (idx, key) in enumerate(zip(to_evaluate, keys)):
+                memo_table_fitness = problem.memo.get(key)
+
+                if memo_table_fitness is None:
+                    misses.append(position)
+                else:
+                    individual = individuals[idx]
+                    individual._table_fitness = memo_table_fitness[table_labels[position, :len(individual)]].tolist()
+                    individual._fitness = sum(individual._table_fitness)
+                    fitnesses[idx] = individual._fitness
+        else:
+            misses = list(range(len(to_evaluate)))
+
+        table_fitness = batch_table_fitness(assignments[misses], problem)
+
+        problem.evaluations += len(misses)
+
+        for position, individual_table_fitness in zip(misses, table_fitness):
+            idx = to_evaluate[position]
+            individual = individuals[idx]
+            individual._table_fitness = individual_table_fitness[:len(individual)].tolist()
+            individual._fitness = sum(individual._table_fitness)
+            fitnesses[idx] = individual._fitness
+
+            if problem.memo is not None:
+                memo_table_fitness = np.zeros(problem.nr_tables + 1, dtype = np.int64)
+                memo_table_fitness[table_labels[position]] = individual_table_fitness
+                memo_table_fitness.flags.writeable = False
+
+                problem.memo.put(keys[position], memo_table_fitness)
+
+    return fitnesses
 
-# Save data in a global variable
-relationships_matrix = relationships.relationships_matrix
 
 class Individual:
     """
     Possible solution to the optimization problem
+
+    The arrangement is kept in one of two forms: the compact assignment (see
+    tables_to_assignment), an int16 array with the table of each guest, or a list of
+    sets with the guests of each table (representation), which the operators work on.
+    Individuals created from an assignment are compact. The sets are built from the
+    assignment the first time they are needed, and compact() discards them again, so
+    the individuals kept in a Population between generations only hold the array.
     """
-    def __init__(self, arrangement = None):
+    __slots__ = ('_tables', '_assignment', 'problem', '_fitness', '_table_fitness')
+
+    def __init__(self, arrangement = None, problem = None):
         """
         Initialize the individual and its representation (list of sets)
 
@@ -24,6 +368,8 @@ class Individual:
                 (list): List of sets, where each set represents a table
                 (frozenset): Frozenset of frozensets, where each frozenset represents a table
                 (None): Create an empty arrangement
+            problem (SeatingProblem, optional): Problem the individual is a solution of.
+                Defaults to the wedding in the data folder.
         """
         representation = []
 
@@ -40,6 +386,49 @@ class Individual:
 
         self.representation = representation
 
+        self.problem = problem if problem is not None else default_problem()
+
+        # Fitness cache: total fitness and fitness of each table.
+        # None means the value has to be (re)computed
+        self._fitness = None
+        self._table_fitness = [None] * len(representation)
+
+    @property
+    def representation(self):
+        """
+         Guests of each table (list of sets). If the individual is compact, the sets are
+         built from the assignment and they become the arrangement from then on
+        """
+        if self._tables is None:
+            tables = assignment_to_tables(self._assignment, len(self._table_fitness))
+
+            self._tables = [set(table.tolist()) for table in tables]
+            self._assignment = None
+
+        return self._tables
+
+    @representation.setter
+    def representation(self, tables):
+        self._tables = tables
+        self._assignment = None
+
+    def compact(self):
+        """
+         Keep only the compact assignment of the arrangement, to save memory. The sets
+         of the tables are built again when they are needed
+
+        Returns:
+            individual (Individual): The individual itself
+        """
+        if self._tables is not None:
+            assignment = tables_to_assignment(self._tables, self.problem.nr_guests)
+            assignment.flags.writeable = False
+
+            self._assignment = assignment
+            self._tables = None
+
+        return self
+
     def __str__(self):
         """
          Solution string representation
@@ -50,53 +439,64 @@ class Individual:
         """
          Returns de number of tables
         """
-        return len(self.representation)
+        return len(self._table_fitness)
     
     def get_fitness(self):
         """
          Solution fitness: sum of the fitness of each table
+         (cached until the arrangement changes)
         """
-        fitness = 0
-        for table_idx in range(len(self.representation)):
-            fitness += self.get_table_fitness(table_idx)
+        if self._fitness is None:
+            fitness = 0
+            for table_idx in range(len(self)):
+                fitness += self.get_table_fitness(table_idx)
+
+            self._fitness = fitness
 
-        return fitness
+            self.problem.evaluations += 1
+
+        return self._fitness
 
     def get_table_fitness(self, table_idx):
         """
          Table fitness: sum of pairwise relationships between guests in the table
+         (cached until the table changes)
         """
-        table_fitness = 0
-
-        table = deepcopy(self.representation[table_idx])
+        if self._table_fitness[table_idx] is None:
+            self._table_fitness[table_idx] = self._compute_table_fitness(table_idx)
 
-        while len(table) > 1:
-            # Get a guest from the table and remove it to ensure that
-            # each relationship is only counted once
-            guest = table.pop()
+        return self._table_fitness[table_idx]
 
-            # Sum the relationships between the guest and the other guests in the table
-            for other_guest in table:
-                table_fitness += relationships_matrix[guest - 1][other_guest - 1]
+    def _compute_table_fitness(self, table_idx):
+        """
+         Computes the table fitness from scratch
+        """
+        # Guests of the table, read from the assignment if the individual is compact
+        if self._tables is None:
+            guests = (np.flatnonzero(self._assignment == table_idx) + 1).tolist()
+        else:
+            guests = list(self._tables[table_idx])
 
-        return table_fitness
+        # Sum of the relationships between every pair of guests in the table
+        return self.problem.table_fitness(guests)
 
     def get_guest_fitness(self, guest, table_idx):
         """
          Guest fitness: sum of relationships between guest and other guests in the table
         """
-        guest_fitness = 0
-
-        table = self.representation[table_idx]
-        
-        if guest not in table:
+        if guest not in self.representation[table_idx]:
             raise Exception('Guest not in table')
 
-        for seated_guest in table:
-            if seated_guest != guest:
-                guest_fitness += relationships_matrix[guest - 1][seated_guest - 1]
-        
-        return guest_fitness
+        return self._guest_contribution(guest, table_idx)
+
+    def _guest_contribution(self, guest, table_idx):
+        """
+         Sum of relationships between guest and the other guests in the table,
+         whether the guest is seated at the table or not
+        """
+        other_guests = [seated_guest for seated_guest in self.representation[table_idx] if seated_guest != guest]
+
+        return self.problem.guest_affinity(guest, other_guests)
     
     def get_guest_max_relationship(self, guest, table_idx):
         """
@@ -106,41 +506,216 @@ class Individual:
         if guest not in self.representation[table_idx]:
             raise Exception('Guest not in table')
         
-        table_matrix = relationships_matrix[guest - 1,[other_guest - 1
-                                                for other_guest in self.representation[table_idx]
-                                                if other_guest != guest]]
+        table_relationships = self.problem.guest_relationships(guest, [other_guest
+                                                                       for other_guest in self.representation[table_idx]
+                                                                       if other_guest != guest])
 
-        return max(table_matrix)
+        return max(table_relationships)
     
     def seat_guest(self, guest, table_idx):
         """
         Add guest to the table set
+
+        The cached fitness is updated with the contribution of the guest
+        to the table, so only the rows of the seated guests are read.
+
+        Returns:
+            delta (int): Change in fitness caused by seating the guest,
+                None if there is no cached fitness to update (it is not computed)
         """
         if guest in self.representation[table_idx]:
             raise Exception('Guest already in table')
+
+        delta = self._guest_contribution(guest, table_idx) if self._is_cached(table_idx) else None
         
         self.representation[table_idx].add(guest)
 
+        self._update_fitness(table_idx, delta)
+
+        return delta
+
     def remove_guest(self, guest, table_idx):
         """
         Remove guest from a given table
+
+        The cached fitness is updated with the contribution of the guest
+        to the table, so only the rows of the seated guests are read.
+
+        Returns:
+            delta (int): Change in fitness caused by removing the guest,
+                None if there is no cached fitness to update (it is not computed)
         """
         if guest not in self.representation[table_idx]:
             raise Exception('Guest not in table')
         
         self.representation[table_idx].remove(guest)
 
+        delta = -self._guest_contribution(guest, table_idx) if self._is_cached(table_idx) else None
+
+        self._update_fitness(table_idx, delta)
+
+        return delta
+
+    def seat_guests(self, guests, table_idx):
+        """
+        Add several guests to the table set
+
+        The cached fitness is updated as in seat_guest, reading the relationships
+        of all the guests at once.
+
+        Returns:
+            delta (int): Change in fitness caused by seating the guests,
+                None if there is no cached fitness to update (it is not computed)
+        """
+        table = self.representation[table_idx]
+
+        if any(guest in table for guest in guests):
+            raise Exception('Guest already in table')
+
+        delta = self._group_contribution(guests, table) if self._is_cached(table_idx) else None
+
+        table.update(guests)
+
+        self._update_fitness(table_idx, delta)
+
+        return delta
+
+    def remove_guests(self, guests, table_idx):
+        """
+        Remove several guests from a given table
+
+        The cached fitness is updated as in remove_guest, reading the relationships
+        of all the guests at once.
+
+        Returns:
+            delta (int): Change in fitness caused by removing the guests,
+                None if there is no cached fitness to update (it is not computed)
+        """
+        table = self.representation[table_idx]
+
+        if not all(guest in table for guest in guests):
+            raise Exception('Guest not in table')
+
+        table.difference_update(guests)
+
+        delta = -self._group_contribution(guests, table) if self._is_cached(table_idx) else None
+
+        self._update_fitness(table_idx, delta)
+
+        return delta
+
+    def _group_contribution(self, guests, table):
+        """
+         Sum of the relationships between the guests and with the other guests in the table
+         (a set without the guests)
+        """
+        if len(guests) == 0:
+            return 0
+
+        guests = list(guests)
+
+        # Relationships of the guests with the guests and with the rest of the table
+        relationships = self.problem.relationships_between(guests, guests + list(table))
+
+        # Pairs of guests are counted twice, once for each guest
+        return int(relationships[:, :len(guests)].sum()) // 2 + int(relationships[:, len(guests):].sum())
+
+    def move_guest(self, guest, from_table_idx, to_table_idx):
+        """
+        Move guest from one table to another
+
+        Returns:
+            delta (int): Change in fitness caused by the move,
+                None if there is no cached fitness to update (it is not computed)
+        """
+        removal_delta = self.remove_guest(guest, from_table_idx)
+        seating_delta = self.seat_guest(guest, to_table_idx)
+
+        if removal_delta is None or seating_delta is None:
+            return None
+
+        return removal_delta + seating_delta
+
     def append_table(self, table):
         """
         Appends a table to the end of the list of tables
         """
         self.representation.append(table)
+        self._table_fitness.append(None)
+        self._fitness = None
 
     def remove_table(self, table_idx):
         """
         Removes a table from the list of tables
         """
         self.representation.pop(table_idx)
+        self._table_fitness.pop(table_idx)
+        self._fitness = None
+
+    def clone(self):
+        """
+        Copy of the individual. Tables are copied (guests are plain integers), the
+        assignment of a compact individual is shared (it is read-only) and the
+        cached fitness is kept
+        """
+        clone = Individual.__new__(Individual)
+
+        clone._tables = [set(table) for table in self._tables] if self._tables is not None else None
+        clone._assignment = self._assignment
+        clone.problem = self.problem
+        clone._fitness = self._fitness
+        clone._table_fitness = list(self._table_fitness)
+
+        return clone
+
+    def canonical_key(self):
+        """
+        Key of the arrangement that does not depend on the order of the tables
+        or of the guests in each table (see canonical_assignments)
+        """
+        return canonical_assignments(self.to_assignment())[0].tobytes()
+
+    def canonical_hash(self):
+        """
+        Hash of the canonical key of the arrangement
+        """
+        return hash(self.canonical_key())
+
+    def to_assignment(self):
+        """
+        Compact representation of the individual (see tables_to_assignment).
+        For a compact individual, its own read-only assignment is returned
+        """
+        if self._tables is None:
+            return self._assignment
+
+        return tables_to_assignment(self._tables, self.problem.nr_guests)
+
+    @classmethod
+    def from_assignment(cls, assignment, problem = None, table_fitness = None):
+        """
+        Create a compact individual from its compact representation (see tables_to_assignment)
+
+        If the fitness of each table is known (e.g. computed in another process),
+        it is used as the cached fitness of the individual
+        """
+        individual = cls.__new__(cls)
+
+        # Copy of the assignment, so it does not keep alive the array it comes from
+        individual._tables = None
+        individual._assignment = np.array(assignment, dtype = np.int16)
+        individual._assignment.flags.writeable = False
+
+        individual.problem = problem if problem is not None else default_problem()
+
+        individual._fitness = None
+        individual._table_fitness = [None] * individual.problem.nr_tables
+
+        if table_fitness is not None:
+            individual._table_fitness = list(table_fitness)
+            individual._fitness = sum(individual._table_fitness)
+
+        return individual
 
     def __getitem__(self, table_idx):
         """
@@ -154,45 +729,170 @@ class Individual:
         """
         self.representation[table_idx] = table
 
+        self._invalidate(table_idx)
+
+    def _is_cached(self, table_idx):
+        """
+        Whether the fitness of a table or of the whole individual is cached, so a change
+        of the table has to update it
+        """
+        return self._fitness is not None or self._table_fitness[table_idx] is not None
+
+    def _update_fitness(self, table_idx, delta):
+        """
+        Add a fitness delta to the cached fitness of a table and of the whole individual
+        (the delta is None when nothing is cached)
+        """
+        if self._table_fitness[table_idx] is not None:
+            self._table_fitness[table_idx] += delta
+
+        if self._fitness is not None:
+            self._fitness += delta
+
+    def _invalidate(self, table_idx):
+        """
+        Discard the cached fitness of a table and of the whole individual
+        """
+        self._table_fitness[table_idx] = None
+        self._fitness = None
+
+
+def breed(p1, p2, xo_prob, mut_prob, crossover, mutate, timings = None):
+    """
+    Create the offspring of two parents by crossover (with probability xo_prob)
+    and mutation (with probability mut_prob). The parents are not modified.
+
+    Args:
+        timings (dict, optional): If given, the time spent in crossover and mutation and
+            the number of calls of each are added to its 'crossover', 'mutation',
+            'crossover_calls' and 'mutation_calls' entries
+
+    Returns:
+        offspring1 (Individual): First offspring
+        offspring2 (Individual): Second offspring, or None if crossover returns only one
+    """
+    if timings is not None:
+        start = time.perf_counter()
+
+    # Crossover
+    if random() < xo_prob:
+        # Note: If crossover returns only one offspring, the second one is None
+        offspring1, offspring2 = crossover(p1, p2)
+
+        if timings is not None:
+            timings['crossover_calls'] += 1
+    else:
+        offspring1, offspring2 = p1.clone(), p2.clone()
+
+    if timings is not None:
+        end = time.perf_counter()
+        timings['crossover'] += end - start
+        start = end
+
+    # Mutation
+    if random() < mut_prob:
+        offspring1 = mutate(offspring1)
+
+        if timings is not None:
+            timings['mutation_calls'] += 1
+    
+    if offspring2 is not None and random() < mut_prob:
+        offspring2 = mutate(offspring2)
+
+        if timings is not None:
+            timings['mutation_calls'] += 1
+
+    if timings is not None:
+        timings['mutation'] += time.perf_counter() - start
+
+    return offspring1, offspring2
+
 
 class Population:
     """
       Search Space of possible solutions
     """
-    def __init__(self, pop_size, nr_guests, nr_tables):
+    def __init__(self, pop_size, nr_guests = None, nr_tables = None, problem = None, heuristic_fraction = 0):
+        """
+        Initialize a population of unique arrangements
 
-        self.nr_guests = nr_guests
+        Args:
+            pop_size (int): Number of individuals
+            nr_guests (int, optional): Number of guests of the default problem
+            nr_tables (int, optional): Number of tables of the default problem
+            problem (SeatingProblem, optional): Problem to solve. If not given, the wedding in the
+                data folder with nr_guests guests and nr_tables tables is used.
+            heuristic_fraction (float, optional): Fraction of the population initialized with
+                greedy_assignment instead of at random
+        """
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+        if problem is None:
+            problem = default_problem(nr_guests, nr_tables)
 
-        self.nr_tables = nr_tables
+        self.problem = problem
 
-        self.guests_per_table = nr_guests // nr_tables
+        self.nr_guests = problem.nr_guests
+
+        self.nr_tables = problem.nr_tables
+
+        self.guests_per_table = problem.guests_per_table
 
         self.pop_size = pop_size
 
         self.individuals = []
 
-        # --------------------- Generate a random population --------------------- #
+        # Best fitness and wall-clock and CPU time (in seconds) of each generation evolved,
+        # over all calls to evolve
+        self.fitness_history = []
 
-        guests = [i for i in range(1, nr_guests + 1)]
-        
-        # Population is a set of unique arrangements
+        self.wall_time_history = []
+
+        self.cpu_time_history = []
+
+        # Reason why the last call to evolve stopped (see evolve)
+        self.stop_reason = None
+
+        # State of the stopping criteria of an evolution resumed from a checkpoint
+        # (see load_checkpoint), used by the next call to evolve
+        self._evolve_state = None
+
+        # --------------------- Generate the initial population --------------------- #
+
+        nr_heuristic = round(heuristic_fraction * pop_size)
+
+        # Heuristic arrangements first, then random ones
+        assignments = [greedy_assignment(problem) for _ in range(nr_heuristic)]
+
+        # Canonical forms of the arrangements in the population.
+        # This prevents the generation of redundant arrangements
         pop = set()
 
-        while len(pop) < pop_size:
-            # Shuffle guests
-            shuffle(guests)
+        unique_assignments = []
+
+        while len(unique_assignments) < pop_size:
+            # Generate the missing arrangements at random, all at once
+            if len(assignments) == 0:
+                assignments = random_assignments(pop_size - len(unique_assignments), problem)
+
+            for assignment, canonical in zip(assignments, canonical_assignments(np.stack(assignments))):
+                key = canonical.tobytes()
 
-            # Create a set of tables, where each table is a set of guests
-            tables = frozenset(frozenset(guests[i:i + self.guests_per_table]) for i in range(0, len(guests), self.nr_tables))
+                # Add the arrangement to the population if it is not already there
+                if key not in pop and len(unique_assignments) < pop_size:
+                    pop.add(key)
+                    unique_assignments.append(assignment)
 
-            # Add the arrangement to the population. If the arrangement is
-            # already in the population, it will not be added because pop is a set
-            # This prevents the generation of redundant arrangements
-            pop.add(tables)
+            assignments = []
 
         # Convert the arrangements to Individuals
-        for arrangement in pop:
-            self.individuals.append(Individual(arrangement))
+        for assignment in unique_assignments:
+            self.individuals.append(Individual.from_assignment(assignment, problem))
+
+        # Time spent generating the initial population
+        self.init_wall_time = time.perf_counter() - wall_start
+
+        self.init_cpu_time = time.process_time() - cpu_start
     
     def __str__(self):
         """
@@ -212,95 +912,482 @@ class Population:
     def get_individuals(self):
         return self.individuals
 
+    def get_fitnesses(self):
+        """
+        Get the fitness of every individual of the population as an array,
+        evaluating all individuals without cached fitness in one vectorized pass
+        """
+        return batch_fitness(self.individuals)
+
+    def save_checkpoint(self, path, evolve_state = None):
+        """
+        Save the population and the state of the random number generators (random and
+        numpy), so the evolution can be resumed with load_checkpoint as if it was never
+        interrupted. The file is written atomically.
+
+        Args:
+            path (str): File of the checkpoint
+            evolve_state (dict, optional): State of the stopping criteria of the evolution
+                in progress (see evolve), restored by the next call to evolve after loading
+        """
+        state = {'problem': self.problem,
+                 'pop_size': self.pop_size,
+                 'assignments': np.stack([individual.to_assignment() for individual in self.individuals]),
+                 'table_fitness': [individual._table_fitness for individual in self.individuals],
+                 'fitness_history': self.fitness_history,
+                 'wall_time_history': self.wall_time_history,
+                 'cpu_time_history': self.cpu_time_history,
+                 'init_wall_time': self.init_wall_time,
+                 'init_cpu_time': self.init_cpu_time,
+                 'random_state': getstate(),
+                 'numpy_random_state': np.random.get_state(),
+                 'evolve_state': evolve_state}
+
+        # Write to a temporary file and rename it, so a crash never leaves a partial checkpoint
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(state, file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        """
+        Load a population saved by save_checkpoint and restore the state of the random
+        number generators. The next call to evolve continues the stopping criteria of
+        the evolution that was saved
+        """
+        with open(path, 'rb') as file:
+            state = pickle.load(file)
+
+        pop = cls.__new__(cls)
+
+        pop.problem = state['problem']
+        pop.nr_guests = pop.problem.nr_guests
+        pop.nr_tables = pop.problem.nr_tables
+        pop.guests_per_table = pop.problem.guests_per_table
+        pop.pop_size = state['pop_size']
+
+        pop.individuals = [Individual.from_assignment(assignment, pop.problem,
+                                                      None if None in table_fitness else table_fitness)
+                           for assignment, table_fitness in zip(state['assignments'], state['table_fitness'])]
+
+        pop.fitness_history = state['fitness_history']
+        pop.wall_time_history = state['wall_time_history']
+        pop.cpu_time_history = state['cpu_time_history']
+        pop.init_wall_time = state['init_wall_time']
+        pop.init_cpu_time = state['init_cpu_time']
+        pop.stop_reason = None
+        pop._evolve_state = state['evolve_state']
+
+        setstate(state['random_state'])
+        np.random.set_state(state['numpy_random_state'])
+
+        return pop
+
+    def diversity(self):
+        """
+        Fraction of unique arrangements in the population
+        """
+        if len(self.individuals) == 0:
+            return 0
+
+        assignments = np.stack([individual.to_assignment() for individual in self.individuals])
+
+        return len(np.unique(canonical_assignments(assignments), axis = 0)) / len(self.individuals)
+
     def best_individuals(self, n = 5):
         """
         Get the best n individual of the population
         (Note: only works for maximization problems)
         """
-        best_n = sorted(self.individuals, key = lambda x: x.get_fitness(), reverse = True)[:n]
+        best_n = np.argsort(-self.get_fitnesses(), kind = 'stable')[:n]
         
-        return [deepcopy(individual) for individual in best_n]
+        return [self.individuals[idx].clone() for idx in best_n]
 
     def best_individual(self):
         """
         Get the best individual of the population
         (Note: only works for maximization problems)
         """
-        return deepcopy(max(self.individuals, key = lambda x: x.get_fitness()))
+        return self.individuals[np.argmax(self.get_fitnesses())].clone()
     
-    def evolve(self, n_generations, xo_prob, mut_prob, select, mutate, crossover, elitism = True, elite_size = 5):
+    def replace_worst(self, individuals):
+        """
+        Replace the worst individuals of the population with the given ones (e.g. migrants)
+        """
+        nr_replaced = min(len(individuals), len(self.individuals))
+
+        if nr_replaced == 0:
+            return
+
+        worst_idx = np.argpartition(self.get_fitnesses(), nr_replaced - 1)[:nr_replaced]
+
+        for idx, individual in zip(worst_idx, individuals):
+            self.individuals[idx] = individual
+
+    def _add_offspring(self, new_pop, offspring, seen_keys = None, local_search = None, timings = None):
+        """
+        Add an offspring to the new population if there is space for it.
+        If a local search operator is given, it refines the offspring first.
+        If seen_keys is given, offspring with an arrangement already in
+        the new population (after the local search) are rejected.
+        """
+        if offspring is None or len(new_pop) >= self.pop_size:
+            return
+
+        if local_search is not None:
+            if timings is not None:
+                local_search_start = time.perf_counter()
+
+            offspring = local_search(offspring)
+
+            if timings is not None:
+                timings['local_search'] += time.perf_counter() - local_search_start
+
+        if seen_keys is not None:
+            key = offspring.canonical_key()
+
+            if key in seen_keys:
+                return
+
+            seen_keys.add(key)
+
+        new_pop.append(offspring)
+
+    def evolve(self, n_generations, xo_prob, mut_prob, select, mutate, crossover, elitism = True, elite_size = 5,
+               pool = None, reject_duplicates = False, hooks = None, verbose = True, stagnation = None,
+               target_fitness = None, time_budget = None, max_evaluations = None, min_diversity = None,
+               checkpoint_path = None, checkpoint_interval = 10, local_search = None, local_search_on = 'offspring'):
+        """
+        Evolve the population for n_generations.
+
+        If an OffspringPool (see charles/parallel.py) is given, the offspring of each
+        generation are bred in parallel by its worker processes.
+
+        If reject_duplicates is True, offspring with the same arrangement as another
+        individual of the new population are discarded, to maintain diversity.
+
+        If a local search operator is given (see charles/local_search.py), it refines
+        every offspring before it is added to the new population, so duplicates are
+        rejected after the local search ('offspring'), or the elite_size best
+        individuals of each new generation ('elite'). It runs in this process, also
+        when the offspring are bred by an OffspringPool.
+
+        The wall-clock and CPU time of each generation are appended to
+        wall_time_history and cpu_time_history.
+
+        The evolution stops before n_generations if one of the stopping criteria given
+        is met, checked at the end of each generation. The criterion that stopped it
+        is saved in stop_reason ('n_generations' if none did).
+
+        Args:
+            hooks (list of GenerationHook, optional): Hooks called at each generation with
+                its timings and statistics (see charles/hooks.py)
+            verbose (bool, optional): Print the best individual of each generation
+            stagnation (int, optional): Stop when the best fitness found has not improved
+                for this many generations ('stagnation')
+            target_fitness (int, optional): Stop when the best fitness reaches this value ('target_fitness')
+            time_budget (float, optional): Stop when the wall-clock time of this call reaches
+                this many seconds ('time_budget')
+            max_evaluations (int, optional): Stop when this many fitness evaluations were done
+                in this call (see SeatingProblem.evaluations) ('max_evaluations')
+            min_diversity (float, optional): Stop when the fraction of unique arrangements in
+                the population falls below this value ('diversity')
+            checkpoint_path (str, optional): File where the population is saved every
+                checkpoint_interval generations (see save_checkpoint)
+            checkpoint_interval (int, optional): Number of generations between checkpoints
+            local_search (function, optional): Operator that improves an Individual in place
+                and returns it, e.g. swap_local_search
+            local_search_on (str, optional): Individuals refined by local_search: 'offspring' or 'elite'
+
+        Returns:
+            fitness_history (list of int): Best fitness of each generation
+            best_indiv (Individual): Best individual of the last generation
+        """
+
+        if local_search_on not in ('offspring', 'elite'):
+            raise ValueError("local_search_on must be 'offspring' or 'elite'")
 
         fitness_history = []
 
+        hooks = list(hooks) if hooks is not None else []
+
+        # Batched version of the selection method, if any (see charles/selection.py)
+        select_batch = getattr(select, 'batch', None)
+
+        # Local search applied to each offspring as it is added to the new population
+        offspring_search = local_search if local_search_on == 'offspring' else None
+
+        # Fitness of the current population
+        fitnesses = self.get_fitnesses()
+
+        # Best individual of the current population, returned if no generation is evolved
+        best_idx = np.argmax(fitnesses)
+
+        # Start of the evolution and best fitness so far, for the stopping criteria
+        evolve_start = time.perf_counter()
+        evaluations_at_start = self.problem.evaluations
+        best_so_far = fitnesses.max() if len(fitnesses) > 0 else None
+        generations_without_improvement = 0
+
+        # Continue the stopping criteria of an evolution resumed from a checkpoint
+        if self._evolve_state is not None:
+            evolve_start -= self._evolve_state['elapsed_time']
+            evaluations_at_start -= self._evolve_state['evaluations']
+            best_so_far = self._evolve_state['best_so_far']
+            generations_without_improvement = self._evolve_state['generations_without_improvement']
+
+            self._evolve_state = None
+
+        self.stop_reason = 'n_generations'
+
         for i in range(n_generations):
 
+            for hook in hooks:
+                hook.on_generation_start(self, i)
+
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+            # Time of each phase of the generation, only measured when there are hooks
+            timings = None
+            if hooks:
+                timings = {'selection': 0, 'crossover': 0, 'mutation': 0, 'local_search': 0,
+                           'crossover_calls': 0, 'mutation_calls': 0, 'nr_selected': 0}
+                evaluations_start = self.problem.evaluations
+
             new_pop = []
 
             if elitism:
-                # Save the best individuals from previous generation
-                elite = self.best_individuals(elite_size)
+                # Indexes of the best individuals from previous generation (top-k in linear time)
+                nr_elite = min(elite_size, len(fitnesses), self.pop_size)
+                elite_idx = np.argpartition(fitnesses, -nr_elite)[-nr_elite:]
+                elite_fitnesses = fitnesses[elite_idx]
 
-            while len(new_pop) < self.pop_size:
-                # Select two parents
-                p1, p2 = select(self), select(self)
+            # Canonical keys of the new population, to reject duplicate offspring.
+            # Duplicates are accepted again if too many pairs of parents were bred
+            seen_keys = set() if reject_duplicates else None
+            nr_pairs_bred = 0
+
+            if pool is None:
+                # Parents of the generation, drawn 2 * pop_size at a time when the selection
+                # method has a batched version (at most two parents per offspring are needed)
+                parents = iter(())
+
+                while len(new_pop) < self.pop_size:
+                    if timings is not None:
+                        selection_start = time.perf_counter()
+
+                    # Select two parents
+                    if select_batch is not None:
+                        p1 = next(parents, None)
+
+                        if p1 is None:
+                            parents = iter(select_batch(fitnesses, 2 * self.pop_size).tolist())
+                            p1 = next(parents)
+
+                        p1, p2 = self.individuals[p1], self.individuals[next(parents)]
+                    else:
+                        p1, p2 = select(self), select(self)
+
+                    if timings is not None:
+                        timings['selection'] += time.perf_counter() - selection_start
+                        timings['nr_selected'] += 2
+
+                    # Crossover and mutation
+                    offspring1, offspring2 = breed(p1, p2, xo_prob, mut_prob, crossover, mutate, timings)
+
+                    nr_pairs_bred += 1
+                    if nr_pairs_bred > MAX_PAIRS_PER_OFFSPRING * self.pop_size:
+                        seen_keys = None
+
+                    # Check if there is still space in the population for each offspring
+                    self._add_offspring(new_pop, offspring1, seen_keys, offspring_search, timings)
+                    self._add_offspring(new_pop, offspring2, seen_keys, offspring_search, timings)
+
+            else:
+                # Parallel breeding: pairs of parents are sent to the pool in rounds until the
+                # new population is full. The number of pairs of each round is estimated from
+                # the number of offspring added per pair in the previous round
+                offspring_per_pair = 2
+
+                while len(new_pop) < self.pop_size:
+                    nr_pairs = ceil((self.pop_size - len(new_pop)) / offspring_per_pair)
+
+                    if timings is not None:
+                        selection_start = time.perf_counter()
+
+                    # Select the parents
+                    if select_batch is not None:
+                        parents = select_batch(fitnesses, 2 * nr_pairs).tolist()
+                        pairs = [(self.individuals[parents[2 * k]], self.individuals[parents[2 * k + 1]])
+                                 for k in range(nr_pairs)]
+                    else:
+                        pairs = [(select(self), select(self)) for _ in range(nr_pairs)]
+
+                    if timings is not None:
+                        breeding_start = time.perf_counter()
+                        timings['selection'] += breeding_start - selection_start
+                        timings['nr_selected'] += 2 * nr_pairs
+
+                    # Crossover and mutation in the worker processes
+                    bred, evaluations = pool.breed(pairs, xo_prob, mut_prob, crossover, mutate)
+
+                    # Offspring are evaluated in the worker processes
+                    self.problem.evaluations += evaluations
+
+                    if timings is not None:
+                        timings['crossover'] += time.perf_counter() - breeding_start
+                        timings['crossover_calls'] += nr_pairs
+
+                    nr_pairs_bred += nr_pairs
+                    if nr_pairs_bred > MAX_PAIRS_PER_OFFSPRING * self.pop_size:
+                        seen_keys = None
+
+                    pop_size_before = len(new_pop)
+
+                    for offspring1, offspring2 in bred:
+                        # Check if there is still space in the population for each offspring
+                        self._add_offspring(new_pop, offspring1, seen_keys, offspring_search, timings)
+                        self._add_offspring(new_pop, offspring2, seen_keys, offspring_search, timings)
+
+                    offspring_per_pair = max(0.5, (len(new_pop) - pop_size_before) / nr_pairs)
+
+            if timings is not None:
+                evaluation_start = time.perf_counter()
+
+            # Evaluate the new population in one pass
+            new_fitnesses = batch_fitness(new_pop)
+
+            if timings is not None:
+                elitism_start = time.perf_counter()
+                timings['evaluation'] = elitism_start - evaluation_start
 
-                # Crossover
-                if random() < xo_prob:
-                    # Note: If crossover returns only one offspring, the second one is None
-                    offspring1, offspring2 = crossover(p1, p2)
-                else:
-                    offspring1, offspring2 = deepcopy(p1), deepcopy(p2)
-
-                # Mutation
-                if random() < mut_prob:
-                    offspring1 = mutate(offspring1)
-                
-                if offspring2 is not None and random() < mut_prob:
-                    offspring2 = mutate(offspring2)
-
-                new_pop.append(offspring1)
-                
-                # Check if there is still space in the population for the second offspring
-                if offspring2 is not None and len(new_pop) < self.pop_size:
-                    new_pop.append(offspring2)
-            
             # Elitism
             if elitism:
-                # Save the worst individuals from the current generation in a list of tuples
-                # The second element of the tuple (True) indicates that the Individual belongs
-                # to the new population
-                worst_ind = [(ind, True) for ind in sorted(new_pop, key = lambda x: x.get_fitness())[:elite_size]]
-
-                # Save the best individuals from the previous generation in a list of tuples
-                # The second element of the tuple (False) indicates that the Individual belongs
-                # to the previous population
-                elite = [(ind, False) for ind in elite]
-
-                # Join the best from the previous generation with the worst from the new onw and sort them
-                elite_aux = sorted(elite + worst_ind, key = lambda x: x[0].get_fitness(), reverse = True)
-
-                # Get best Individuals to keep
-                individuals_to_keep = elite_aux[:elite_size]
-                # Get worst Individuals to discard
-                individuals_to_discard = elite_aux[elite_size:]
-                
-                # Remove necessary individuals from the new population
-                for (individual, in_pop) in individuals_to_discard:
-                    if in_pop:
-                        new_pop.pop(new_pop.index(individual))
-                
-                # Add the new individuals from elite to the new population
-                for (individual, in_pop) in individuals_to_keep:
-                    if not in_pop:
-                        new_pop.append(individual)
-
-            # Replace the old population with the new one
-            self.individuals = new_pop
-
-            best_indiv = self.best_individual()
-            print(f'Best individual in generation {i}: {best_indiv} Fitness: {best_indiv.get_fitness()}')
-
-            # Save the best fitness of the generation
-            fitness_history.append(best_indiv.get_fitness())
-
-        return fitness_history, best_indiv
\ No newline at end of file
+                # Indexes of the worst individuals from the current generation (bottom-k in linear time)
+                worst_idx = np.argpartition(new_fitnesses, nr_elite - 1)[:nr_elite]
+
+                # Join the best from the previous generation with the worst from the new one and
+                # keep the best of them. Candidates 0..nr_elite-1 are the elite and the rest are
+                # the worst individuals, so the stable sort prefers the elite on ties
+                candidates_fitnesses = np.concatenate((elite_fitnesses, new_fitnesses[worst_idx]))
+                to_keep = np.argsort(-candidates_fitnesses, kind = 'stable')[:nr_elite]
+
+                # Elite individuals to keep
+                elite_to_keep = to_keep[to_keep < nr_elite]
+
+                # Positions in the new population of the worst individuals to discard
+                to_discard = worst_idx[np.setdiff1d(np.arange(nr_elite), to_keep[to_keep >= nr_elite] - nr_elite)]
+
+                # Canonical keys of the individuals of the new population that are kept, so
+                # elite individuals already in it are not added again
+                kept_keys = None
+                if reject_duplicates:
+                    kept = np.setdiff1d(np.arange(len(new_pop)), to_discard)
+                    kept_assignments = np.stack([new_pop[idx].to_assignment() for idx in kept])
+                    kept_keys = {canonical.tobytes() for canonical in canonical_assignments(kept_assignments)}
+
+                # Replace each discarded individual with an elite individual
+                for elite_pos, new_pos in zip(elite_to_keep, to_discard):
+                    elite = self.individuals[elite_idx[elite_pos]]
+
+                    if kept_keys is not None:
+                        key = elite.canonical_key()
+
+                        # The arrangement is already in the new population
+                        if key in kept_keys:
+                            continue
+
+                        kept_keys.add(key)
+
+                    new_pop[new_pos] = elite.clone()
+                    new_fitnesses[new_pos] = elite_fitnesses[elite_pos]
+
+            if timings is not None:
+                timings['elitism'] = time.perf_counter() - elitism_start
+
+            # Local search on the best individuals of the new generation
+            if local_search is not None and local_search_on == 'elite':
+                if timings is not None:
+                    local_search_start = time.perf_counter()
+
+                nr_refined = min(elite_size, len(new_fitnesses))
+
+                for idx in np.argpartition(new_fitnesses, -nr_refined)[-nr_refined:]:
+                    new_pop[idx] = local_search(new_pop[idx])
+                    new_fitnesses[idx] = new_pop[idx].get_fitness()
+
+                if timings is not None:
+                    timings['local_search'] += time.perf_counter() - local_search_start
+
+            # Replace the old population with the new one. Only the compact assignment
+            # of each individual is kept until it is used again
+            self.individuals = [individual.compact() for individual in new_pop]
+            fitnesses = new_fitnesses
+
+            best_idx = np.argmax(fitnesses)
+
+            if verbose:
+                print(f'Best individual in generation {i}: {self.individuals[best_idx]} Fitness: {fitnesses[best_idx]}')
+
+            # Save the best fitness and the duration of the generation
+            fitness_history.append(int(fitnesses[best_idx]))
+            self.fitness_history.append(int(fitnesses[best_idx]))
+
+            wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+            self.wall_time_history.append(wall_time)
+            self.cpu_time_history.append(cpu_time)
+
+            # Fraction of unique arrangements, only computed when it is used
+            diversity = self.diversity() if hooks or min_diversity is not None else None
+
+            if hooks:
+                for hook in hooks:
+                    hook.on_selection(self, i, timings['selection'], timings['nr_selected'])
+                    hook.on_crossover(self, i, timings['crossover'], timings['crossover_calls'])
+                    hook.on_mutation(self, i, timings['mutation'], timings['mutation_calls'])
+
+                stats = {'best': int(fitnesses[best_idx]), 'mean': float(fitnesses.mean()),
+                         'std': float(fitnesses.std()), 'diversity': diversity,
+                         'evaluations': self.problem.evaluations - evaluations_start,
+                         'wall_time': wall_time, 'cpu_time': cpu_time,
+                         'selection_time': timings['selection'], 'crossover_time': timings['crossover'],
+                         'mutation_time': timings['mutation'], 'evaluation_time': timings['evaluation'],
+                         'elitism_time': timings['elitism'], 'local_search_time': timings['local_search']}
+
+                for hook in hooks:
+                    hook.on_generation_end(self, i, stats)
+
+            # ---- Stopping criteria ---- #
+            if best_so_far is None or fitnesses[best_idx] > best_so_far:
+                best_so_far = fitnesses[best_idx]
+                generations_without_improvement = 0
+            else:
+                generations_without_improvement += 1
+
+            if target_fitness is not None and best_so_far >= target_fitness:
+                self.stop_reason = 'target_fitness'
+            elif stagnation is not None and generations_without_improvement >= stagnation:
+                self.stop_reason = 'stagnation'
+            elif time_budget is not None and time.perf_counter() - evolve_start >= time_budget:
+                self.stop_reason = 'time_budget'
+            elif max_evaluations is not None and self.problem.evaluations - evaluations_at_start >= max_evaluations:
+                self.stop_reason = 'max_evaluations'
+            elif min_diversity is not None and diversity < min_diversity:
+                self.stop_reason = 'diversity'
+
+            if self.stop_reason != 'n_generations':
+                if verbose:
+                    print(f'Stopped after generation {i}: {self.stop_reason}')
+                break
+
+            # Checkpoint (not after the last generation, when the evolution is over)
+            if checkpoint_path is not None and (i + 1) % checkpoint_interval == 0 and i < n_generations - 1:
+                self.save_checkpoint(checkpoint_path,
+                                     {'elapsed_time': time.perf_counter() - evolve_start,
+                                      'evaluations': self.problem.evaluations - evaluations_at_start,
+                                      'best_so_far': None if best_so_far is None else int(best_so_far),
+                                      'generations_without_improvement': generations_without_improvement})
+
+        return fitness_history, self.individuals[best_idx].clone()
@@ -1,12 +1,15 @@
 from random import sample, random, randint
 import itertools
+from math import comb
 from collections import Counter
-from copy import deepcopy
+
+import numpy as np
 
 from charles.charles import Individual
 
 
-def get_best_combination(guests_to_seat, nr_guests_to_fill, table_to_fill, offspring):
+def get_best_combination(guests_to_seat, nr_guests_to_fill, table_to_fill, offspring,
+                         fill_mode = 'beam', beam_width = 5, exact_budget = 10000):
     """
     Auxiliary function for GBX crossover.
 
@@ -14,46 +17,88 @@ def get_best_combination(guests_to_seat, nr_guests_to_fill, table_to_fill, offsp
     by finding the combination that maximizes the fitness of the table. In the end, the best
     combination is added to the table and the table is added to the offspring.
 
+    Candidates are scored with precomputed affinity vectors: the relationship of each
+    guest with the guests already at the table, plus the relationships among the guests
+    chosen so far. The search is done in one of the following modes:
+        - 'greedy': seats, one at a time, the guest with the highest affinity
+        - 'beam': keeps the beam_width best partial combinations at each step
+        - 'exact': scores every combination, as long as there are at most exact_budget
+                   of them. Otherwise falls back to 'beam'.
+
     Input:  guests_to_set (set of int)
             nr_guests_to_fill (int)
             table_to_fill (list of int)
             offspring (Individual)
+            fill_mode (str, optional)
+            beam_width (int, optional)
+            exact_budget (int, optional)
     Returns:
         best_comb (list of int): The best combination of guests used to fill the table.
         offspring (Individual): The offspring after the table is filled with the best combination.
     """
+    if fill_mode not in ('greedy', 'beam', 'exact'):
+        raise ValueError(f'Unknown fill mode: {fill_mode}')
 
-    # Possible combinations of people to fill the table
-    guests_combinations = list(itertools.combinations(guests_to_seat, nr_guests_to_fill))
+    problem = offspring.problem
 
-    best_fitness = -100000
-    best_table = None
-    best_comb = None
+    candidates = np.array(sorted(guests_to_seat))
 
-    for comb in guests_combinations:
-        # Add guests to the table to fill
-        table_aux = table_to_fill | set(comb)
+    # Relationship of each candidate with the guests already at the table
+    affinity = problem.affinity(candidates, list(table_to_fill))
 
-        # Append table to offspring
-        offspring.append_table(table_aux)
+    if fill_mode == 'exact' and comb(len(candidates), nr_guests_to_fill) <= exact_budget:
+        # Relationships among candidates
+        pairs = problem.relationships_between(candidates, candidates)
+
+        combinations = np.array(list(itertools.combinations(range(len(candidates)), nr_guests_to_fill)),
+                                dtype = np.intp).reshape(-1, nr_guests_to_fill)
+
+        # Gain in table fitness of each combination (pairs among candidates are counted twice)
+        gains = affinity[combinations].sum(axis = 1) + \
+                pairs[combinations[:, :, None], combinations[:, None, :]].sum(axis = (1, 2)) // 2
+
+        best_positions = combinations[np.argmax(gains)]
+
+    else:
+        width = 1 if fill_mode == 'greedy' else beam_width
+
+        # Each state is (gain, chosen positions, affinity of the candidates to the table with the chosen guests)
+        beam = [(0, (), affinity)]
+
+        # Relationships of the chosen candidates with all the candidates, read when first needed
+        pair_rows = {}
+
+        for _ in range(nr_guests_to_fill):
+            expansions = {}
+
+            for gain, chosen, state_affinity in beam:
+                state_gains = gain + state_affinity
+                state_gains[list(chosen)] = np.iinfo(np.int64).min
+
+                # Best extensions of the state
+                nr_expansions = min(width, len(candidates) - len(chosen))
+                for position in np.argpartition(state_gains, -nr_expansions)[-nr_expansions:]:
+                    new_chosen = tuple(sorted(chosen + (position,)))
+
+                    if new_chosen not in expansions:
+                        if position not in pair_rows:
+                            pair_rows[position] = problem.guest_relationships(int(candidates[position]), candidates)
+
+                        expansions[new_chosen] = (state_gains[position], new_chosen,
+                                                  state_affinity + pair_rows[position])
+
+            beam = sorted(expansions.values(), key = lambda state: state[0], reverse = True)[:width]
+
+        best_positions = list(beam[0][1])
+
+    best_comb = tuple(candidates[best_positions].tolist())
 
-        # Calculate table fitness
-        table_fitness = offspring.get_table_fitness(-1)
-        
-        if table_fitness >= best_fitness:
-            best_fitness = table_fitness
-            best_table = table_aux
-            best_comb = comb
-        
-        # Remove table from offspring
-        offspring.remove_table(-1)
-    
     # Add table with highest fitness to offspring
-    offspring.append_table(best_table)
+    offspring.append_table(table_to_fill | set(best_comb))
 
     return best_comb, offspring
 
-def gbx_crossover(p1, p2):
+def gbx_crossover(p1, p2, fill_mode = 'beam', beam_width = 5, exact_budget = 10000):
     """
     Group based crossover (GBX) implementation.
 
@@ -70,6 +115,10 @@ def gbx_crossover(p1, p2):
     Args:
         p1 (Individual): First parent for crossover.
         p2 (Individual): Second parent for crossover.
+        fill_mode (str, optional): How tables are filled: 'greedy', 'beam' or 'exact'
+                                   (see get_best_combination).
+        beam_width (int, optional): Number of partial combinations kept in 'beam' mode.
+        exact_budget (int, optional): Maximum number of combinations scored in 'exact' mode.
 
     Returns:
         offspring (Individual): One offspring resulting from the crossover.
@@ -91,14 +140,14 @@ def gbx_crossover(p1, p2):
     num_tables_to_keep = int(tables_pct * len(p1))
 
     # Get the tables to keep from the first parent and add them to the offspring
-    offspring = Individual(sample(deepcopy(p1).representation, num_tables_to_keep))
+    offspring = Individual([set(table) for table in sample(p1.representation, num_tables_to_keep)], p1.problem)
 
     # Save the guests seated guests and the guests yet to seat
     seated_guests = {guest for table in offspring for guest in table}
-    guests_to_seat = set(range(1, len(p1) * seats_per_table + 1)) - seated_guests
+    guests_to_seat = set(p1.problem.guests) - seated_guests
 
     # Remove seated guests from the second parent
-    p2_remaining = [table.difference(seated_guests) for table in deepcopy(p2)]
+    p2_remaining = [table.difference(seated_guests) for table in p2]
 
     # ----------------------- Filling of tables from p2 ----------------------- #
 
@@ -126,7 +175,8 @@ def gbx_crossover(p1, p2):
 
             # Get the best combination of guests to fill the table and add it to the offspring
             # Also return the best combination of guests so they can be removed from the guests to seat
-            best_comb, offspring = get_best_combination(guests_to_seat, nr_guests_to_fill, table_to_fill, offspring)
+            best_comb, offspring = get_best_combination(guests_to_seat, nr_guests_to_fill, table_to_fill, offspring,
+                                                        fill_mode, beam_width, exact_budget)
 
             # Remove the seated guests from the guests to seat
             guests_to_seat -= set(best_comb)
@@ -164,27 +214,28 @@ def eager_breeder_crossover(p1, p2):
     p1_idx = 0
     p2_idx = 0
 
-    # Sort parents by table fitness
-    p1.representation = sorted(p1, key=lambda table: p1.get_table_fitness(p1.representation.index(table)), reverse=True)
-    p2.representation = sorted(p2, key=lambda table: p2.get_table_fitness(p2.representation.index(table)), reverse=True)
+    # Sort the tables of each parent by table fitness (parents are left untouched)
+    p1_order = sorted(range(len(p1)), key=lambda table_idx: p1.get_table_fitness(table_idx), reverse=True)
+    p2_order = sorted(range(len(p2)), key=lambda table_idx: p2.get_table_fitness(table_idx), reverse=True)
 
     # Initialize offspring
-    offspring = Individual(arrangement = None)
+    offspring = Individual(arrangement = None, problem = p1.problem)
 
     guests_per_table = len(p1[0])
-    nr_guests = len(p1) * guests_per_table
+    nr_guests = p1.problem.nr_guests
+    problem = p1.problem
 
     # ------------------------- Collection phase ------------------------- #
 
     # Add tables with best fitness until child has the correct number of tables
     while(len(offspring) < len(p1)):
-        fit_table1 = p1.get_table_fitness(p1_idx)
-        fit_table2 = p2.get_table_fitness(p2_idx)
+        fit_table1 = p1.get_table_fitness(p1_order[p1_idx])
+        fit_table2 = p2.get_table_fitness(p2_order[p2_idx])
         if fit_table1 >= fit_table2:
-            offspring.append_table(deepcopy(p1[p1_idx]))
+            offspring.append_table(set(p1[p1_order[p1_idx]]))
             p1_idx += 1
         else:
-            offspring.append_table(deepcopy(p2[p2_idx]))
+            offspring.append_table(set(p2[p2_order[p2_idx]]))
             p2_idx += 1
 
         
@@ -196,56 +247,54 @@ def eager_breeder_crossover(p1, p2):
     # Get the guests that are seated more than once
     repeated_guests = {guest for guest, count in guest_counts.items() if count > 1}
 
+    # Tables where each repeated guest is seated
+    guest_tables = {guest: [] for guest in repeated_guests}
+    for table_idx, table in enumerate(offspring.representation):
+        for guest in table & repeated_guests:
+            guest_tables[guest].append(table_idx)
+
     # Remove guest from table where he contributed the least to fitness
     for guest in repeated_guests:
-        # To save guest fitness in each table
-        guest_fitnesses = []
-        tables_idx = []
-
-        for table_idx, table in enumerate(offspring):
-            if guest in table:
-                # Get contribution of guest to table fitness
-                guest_fitnesses.append(offspring.get_guest_fitness(guest, table_idx))
+        tables_idx = guest_tables[guest]
 
-                # Save table index
-                tables_idx.append(table_idx)
+        # Get contribution of guest to the fitness of each table
+        guest_fitnesses = [offspring.get_guest_fitness(guest, table_idx) for table_idx in tables_idx]
 
 
         # Remove guest from the table where it contributes the less to fitness
         if guest_fitnesses[0] >= guest_fitnesses[1]:
-            offspring[tables_idx[1]].remove(guest)
+            offspring.remove_guest(guest, tables_idx[1])
         else:
-            offspring[tables_idx[0]].remove(guest)
+            offspring.remove_guest(guest, tables_idx[0])
 
     
     # Fill the empty seats with guests that are not seated yet
-    not_seated_guests = [guest for guest in range(1, nr_guests + 1) if guest not in guest_counts]
+    not_seated_guests = np.array([guest for guest in range(1, nr_guests + 1) if guest not in guest_counts], dtype = np.intp)
 
-    for table_idx in range(len(offspring)):
-        
-        while len(offspring[table_idx]) < guests_per_table:
-            max_fitness = -100000
-            guest_max_fitness = None
+    if len(not_seated_guests) == 0:
+        return offspring, None
 
-            for guest in not_seated_guests:
-                # Seat guest at the table
-                offspring.seat_guest(guest, table_idx)
+    # Affinity of each guest not seated to each table: sum of the relationships
+    # with the guests at the table, i.e. the increase in table fitness if seated there
+    affinity = problem.table_affinity(not_seated_guests, offspring.to_assignment(), len(offspring))
 
-                # Get table fitness
-                table_fitness = offspring.get_table_fitness(table_idx)
+    # Guests already seated during the repair are masked out
+    available = np.ones(len(not_seated_guests), dtype = bool)
 
-                if table_fitness > max_fitness:
-                    max_fitness = table_fitness
-                    guest_max_fitness = guest
+    for table_idx in range(len(offspring)):
+        
+        while len(offspring[table_idx]) < guests_per_table:
+            # The guest that increases the table fitness the most
+            best_guest_idx = np.argmax(np.where(available, affinity[:, table_idx], np.iinfo(np.int64).min))
 
-                # Remove guest from the table
-                offspring.remove_guest(guest, table_idx)
+            best_guest = int(not_seated_guests[best_guest_idx])
 
             # Seat the guest that has the highest fitness
-            offspring.seat_guest(guest_max_fitness, table_idx)
+            offspring.seat_guest(best_guest, table_idx)
             
-            # Remove guest from the list of not seated guests
-            not_seated_guests.remove(guest_max_fitness)
+            # Remove guest from the guests not seated and update the affinity to the table
+            available[best_guest_idx] = False
+            affinity[:, table_idx] += problem.guest_relationships(best_guest, not_seated_guests)
 
     return offspring, None
 
@@ -274,7 +323,7 @@ def twin_maker(p1, p2):
     offspring1 = [set() for _ in range(len(p1))]
     offspring2 = [set() for _ in range(len(p2))]
 
-    nr_guests = len(p1) * len(p1[0])
+    nr_guests = p1.problem.nr_guests
     seats_per_table = len(p1[0])
 
     # Get random guests to keep
@@ -305,5 +354,5 @@ def twin_maker(p1, p2):
                     # Seat guest in the table
                     offspring[offspring_idx].add(guest)
                         
-    return Individual(offspring1), Individual(offspring2)
+    return Individual(offspring1, p1.problem), Individual(offspring2, p1.problem)
 
@@ -0,0 +1,117 @@
+"""
+Hooks of Population.evolve.
+
+A hook receives the progress of the GA at fixed points of every generation.
+Selection, crossover and mutation are interleaved while the new population is
+bred, so their hooks are called once per generation, after breeding, with the
+total time spent in each phase.
+
+Timings are only measured when at least one hook is given to evolve.
+"""
+
+import numpy as np
+
+
+class GenerationHook:
+    """
+    Base class of the hooks of Population.evolve. Subclasses override the
+    methods they need; the default ones do nothing.
+    """
+    def on_generation_start(self, population, generation):
+        """
+        Called before breeding a new generation
+
+        Args:
+            population (Population): Population being evolved (still the previous generation)
+            generation (int): Number of the generation, from 0 on each call to evolve
+        """
+
+    def on_selection(self, population, generation, elapsed, nr_selected):
+        """
+        Called after breeding, with the time spent selecting parents
+
+        Args:
+            elapsed (float): Wall-clock time (seconds) spent in selection
+            nr_selected (int): Number of parents selected
+        """
+
+    def on_crossover(self, population, generation, elapsed, nr_calls):
+        """
+        Called after breeding, with the time spent in crossover.
+
+        When the offspring are bred by an OffspringPool, elapsed is the time spent
+        waiting for the pool (crossover and mutation) and nr_calls is the number of
+        pairs of parents sent to it.
+
+        Args:
+            elapsed (float): Wall-clock time (seconds) spent in crossover
+            nr_calls (int): Number of crossovers
+        """
+
+    def on_mutation(self, population, generation, elapsed, nr_calls):
+        """
+        Called after breeding, with the time spent in mutation (0 when an
+        OffspringPool is used, see on_crossover)
+
+        Args:
+            elapsed (float): Wall-clock time (seconds) spent in mutation
+            nr_calls (int): Number of mutations
+        """
+
+    def on_generation_end(self, population, generation, stats):
+        """
+        Called when the new generation has replaced the previous one
+
+        Args:
+            population (Population): Population with the new generation
+            generation (int): Number of the generation
+            stats (dict): Statistics of the generation:
+                - best, mean, std: Fitness statistics of the population
+                - diversity: Fraction of unique arrangements in the population
+                - evaluations: Fitness evaluations of the generation (see SeatingProblem.evaluations)
+                - wall_time, cpu_time: Duration of the generation (hooks excluded)
+                - selection_time, crossover_time, mutation_time, evaluation_time,
+                  elitism_time, local_search_time: Wall-clock time of each phase
+        """
+
+
+class TimingCollector(GenerationHook):
+    """
+    Hook that keeps the statistics of every generation, to find where the
+    generation time goes
+    """
+    def __init__(self):
+        # Statistics of each generation (see GenerationHook.on_generation_end)
+        self.history = []
+
+    def on_generation_end(self, population, generation, stats):
+        self.history.append(stats)
+
+    def get(self, name):
+        """
+        Value of a statistic in each generation
+
+        Returns:
+            (np.ndarray): One value per generation
+        """
+        return np.array([stats[name] for stats in self.history])
+
+    def summary(self):
+        """
+        Total time of each phase over all generations and its share of the wall-clock time
+
+        Returns:
+            (dict): {phase: (total time in seconds, fraction of the generation time)}
+        """
+        total = float(self.get('wall_time').sum()) if self.history else 0
+
+        summary = {}
+
+        for phase in ('selection', 'crossover', 'mutation', 'evaluation', 'elitism', 'local_search'):
+            phase_total = float(self.get(f'{phase}_time').sum()) if self.history else 0
+            summary[phase] = (phase_total, phase_total / total if total > 0 else 0)
+
+        other = total - sum(phase_total for phase_total, _ in summary.values())
+        summary['other'] = (other, other / total if total > 0 else 0)
+
+        return summary
@@ -0,0 +1,222 @@
+"""
+Island model of the GA.
+
+Several populations (islands) evolve in separate processes. Every
+migration_interval generations each island sends copies of its best individuals
+to other islands, following a migration topology, and replaces its worst
+individuals with the migrants it receives. Individuals travel between processes
+in their compact representation (guest to table assignment arrays).
+"""
+
+from math import ceil
+from multiprocessing import Process, Queue
+from queue import Empty
+from traceback import format_exc
+
+import numpy as np
+
+from charles.charles import Population, Individual
+from charles.parallel import seed_rngs, task_seed
+from charles.problem import default_problem
+
+TOPOLOGIES = ('ring', 'fully_connected', 'random')
+
+# Seconds between the checks of the island processes while waiting for their results
+POLL_INTERVAL = 1
+
+
+def migration_targets(topology, n_islands, epoch, seed = 0):
+    """
+    Islands that receive migrants from each island at a given epoch.
+
+    Args:
+        topology (str): 'ring' (each island sends to the next one),
+                        'fully_connected' (each island sends to all the others) or
+                        'random' (each island sends to another island drawn at random)
+        n_islands (int): Number of islands
+        epoch (int): Number of the migration. The random topology changes every epoch
+                     and is the same in all processes, as it only depends on the seed.
+        seed (int, optional): Base seed
+
+    Returns:
+        targets (list of lists of int): Target islands of each island
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError(f'Unknown migration topology: {topology}')
+
+    if n_islands < 2:
+        return [[] for _ in range(n_islands)]
+
+    if topology == 'ring':
+        return [[(island + 1) % n_islands] for island in range(n_islands)]
+
+    if topology == 'fully_connected':
+        return [[target for target in range(n_islands) if target != island] for island in range(n_islands)]
+
+    rng = np.random.default_rng(task_seed(seed, ('migration', epoch)))
+
+    targets = []
+    for island in range(n_islands):
+        # Draw among the other islands
+        target = int(rng.integers(n_islands - 1))
+        targets.append([target + 1 if target >= island else target])
+
+    return targets
+
+def _island_worker(island, n_islands, problem, pop_size, generations_per_epoch, n_migrants,
+                   topology, seed, inboxes, results, evolve_kwargs):
+    """
+    Evolve one island and exchange migrants with the other islands. The result, or the
+    traceback of the exception that stopped the island, is put in the results queue.
+    """
+    try:
+        _evolve_island(island, n_islands, problem, pop_size, generations_per_epoch, n_migrants,
+                       topology, seed, inboxes, results, evolve_kwargs)
+    except Exception:
+        results.put((island, 'error', format_exc()))
+
+def _evolve_island(island, n_islands, problem, pop_size, generations_per_epoch, n_migrants,
+                   topology, seed, inboxes, results, evolve_kwargs):
+    """
+    Evolve one island (see _island_worker)
+    """
+    seed_rngs(task_seed(seed, ('island', island)))
+
+    pop = Population(pop_size = pop_size, problem = problem)
+
+    fitness_history = []
+
+    # Migrants received ahead of time, by epoch
+    pending = {}
+
+    for epoch, n_generations in enumerate(generations_per_epoch):
+        history, best_indiv = pop.evolve(n_generations = n_generations, **evolve_kwargs)
+        fitness_history += history
+
+        # No migration after the last epoch
+        if epoch == len(generations_per_epoch) - 1:
+            break
+
+        targets = migration_targets(topology, n_islands, epoch, seed)
+
+        # Send the best individuals to the target islands
+        migrants = [individual.to_assignment() for individual in pop.best_individuals(n_migrants)]
+
+        for target in targets[island]:
+            inboxes[target].put((epoch, migrants))
+
+        # Wait for the migrants sent to this island in this epoch
+        nr_sources = sum(island in island_targets for island_targets in targets)
+
+        while len(pending.get(epoch, [])) < nr_sources:
+            message_epoch, message = inboxes[island].get()
+            pending.setdefault(message_epoch, []).append(message)
+
+        received = [Individual.from_assignment(assignment, problem)
+                    for message in pending.pop(epoch, []) for assignment in message]
+
+        pop.replace_worst(received)
+
+    results.put((island, 'done', (fitness_history, best_indiv.to_assignment())))
+
+def _collect_results(processes, results):
+    """
+    Wait for the result of every island
+
+    If an island raises an exception or its process dies, the other islands would wait
+    forever for its migrants, so they are terminated and a RuntimeError is raised.
+
+    Returns:
+        island_results (list): Fitness history and best assignment of each island
+    """
+    island_results = [None] * len(processes)
+    nr_pending = len(processes)
+
+    while nr_pending > 0:
+        try:
+            island, status, result = results.get(timeout = POLL_INTERVAL)
+        except Empty:
+            # Processes that ended without sending their result
+            failed = [island for island, process in enumerate(processes)
+                      if not process.is_alive() and process.exitcode != 0 and island_results[island] is None]
+
+            if failed:
+                _terminate(processes)
+                raise RuntimeError(f'Island {failed[0]} exited with code {processes[failed[0]].exitcode}')
+
+            continue
+
+        if status == 'error':
+            _terminate(processes)
+            raise RuntimeError(f'Island {island} raised an exception:\n{result}')
+
+        island_results[island] = result
+        nr_pending -= 1
+
+    return island_results
+
+def _terminate(processes):
+    """
+    Stop the island processes that are still running
+    """
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+    for process in processes:
+        process.join()
+
+def run_islands(n_islands, pop_size, n_generations, migration_interval, n_migrants = 2,
+                topology = 'ring', problem = None, seed = 0, **evolve_kwargs):
+    """
+    Run the island model GA.
+
+    Args:
+        n_islands (int): Number of islands, each one evolved in its own process
+        pop_size (int): Size of the population of each island
+        n_generations (int): Number of generations
+        migration_interval (int): Number of generations between migrations
+        n_migrants (int, optional): Number of individuals sent to each target island
+        topology (str, optional): Migration topology (see migration_targets)
+        problem (SeatingProblem, optional): Problem to solve. Defaults to the wedding in the data folder.
+        seed (int, optional): Base seed of the islands and of the random topology
+        evolve_kwargs: Remaining arguments of Population.evolve (xo_prob, mut_prob, select, ...)
+
+    Returns:
+        fitness_histories (list of lists of int): Best fitness of each generation, for each island
+        best_individual (Individual): Best individual found in the last generation among the islands
+
+    If an island fails, the other islands are terminated and a RuntimeError is raised.
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError(f'Unknown migration topology: {topology}')
+
+    problem = problem if problem is not None else default_problem()
+
+    # Number of generations evolved between migrations
+    n_epochs = ceil(n_generations / migration_interval)
+    generations_per_epoch = [migration_interval] * (n_epochs - 1) + [n_generations - migration_interval * (n_epochs - 1)]
+
+    inboxes = [Queue() for _ in range(n_islands)]
+    results = Queue()
+
+    processes = [Process(target = _island_worker,
+                         args = (island, n_islands, problem, pop_size, generations_per_epoch, n_migrants,
+                                 topology, seed, inboxes, results, evolve_kwargs))
+                 for island in range(n_islands)]
+
+    for process in processes:
+        process.start()
+
+    # Collect the results before joining, so the processes can flush their queues
+    island_results = _collect_results(processes, results)
+
+    for process in processes:
+        process.join()
+
+    fitness_histories = [fitness_history for fitness_history, _ in island_results]
+
+    best_individual = max((Individual.from_assignment(assignment, problem) for _, assignment in island_results),
+                          key = lambda individual: individual.get_fitness())
+
+    return fitness_histories, best_individual
@@ -0,0 +1,169 @@
+"""
+Local search operators for WSC Individuals, to refine the offspring or the elite
+of the GA (see the local_search argument of Population.evolve).
+
+The operators keep a guest x table affinity matrix: the sum of the relationships
+of each guest with the guests seated at each table. The gain of swapping guest g
+(at table t_g) with guest h (at table t_h) is then computed in O(1):
+
+    gain = (aff[g, t_h] - R[g, h]) - aff[g, t_g] + (aff[h, t_g] - R[h, g]) - aff[h, t_h]
+
+and after a swap only the entries of the neighbors of the two guests change.
+
+The relationships are read through the methods of the problem, so the operators
+work with any storage backend (see charles/problem.py). Guests are moved through
+the Individual API, which keeps its cached fitness up to date.
+
+Each swap whose gain is computed evaluates a neighbor arrangement, so it is counted
+as one fitness evaluation in problem.evaluations (see SeatingProblem), and the
+evaluation budgets of the GA (max_evaluations in Population.evolve) include them.
+"""
+
+from random import shuffle
+import numpy as np
+
+# Gain of the swaps that are not allowed (two guests of the same table)
+NO_SWAP = np.iinfo(np.int64).min // 4
+
+
+def swap_local_search(individual, strategy = 'first', max_moves = None):
+    """
+    Pairwise swap local search for a GGA individual
+
+    Guests of different tables are swapped while some swap improves the fitness,
+    until the individual is a local optimum or max_moves swaps were made.
+
+    Strategies:
+        - 'first': guests are visited in random order and each one is swapped with
+          the guest that gives it the best gain, if the gain is positive. Each visit
+          takes O(nr_guests) time.
+        - 'best': the swap with the best gain over all pairs of guests is made at
+          each step. Each step takes O(nr_guests^2) time and memory, so it is meant
+          for small guest lists.
+
+    Args:
+        individual (Individual): An individual from charles.py
+        strategy (str, optional): 'first' or 'best'
+        max_moves (int, optional): Maximum number of swaps. Unlimited by default.
+    Returns:
+        individual (Individual): Improved Individual
+    """
+    if strategy not in ('first', 'best'):
+        raise ValueError("strategy must be 'first' or 'best'")
+
+    problem = individual.problem
+
+    guests = np.arange(1, problem.nr_guests + 1)
+
+    # Table of each guest (indexed by guest - 1) and affinity of each guest with each table
+    assignment = individual.to_assignment().astype(np.int64)
+    affinity = problem.table_affinity(guests, assignment, len(individual))
+
+    if strategy == 'first':
+        _first_improvement(individual, affinity, assignment, max_moves)
+    else:
+        _best_improvement(individual, affinity, assignment, max_moves)
+
+    return individual
+
+def _first_improvement(individual, affinity, assignment, max_moves):
+    """
+    Swap each guest, in random order, with its best partner while it improves the fitness
+    """
+    problem = individual.problem
+    nr_guests = problem.nr_guests
+    rows = np.arange(nr_guests)
+
+    nr_moves = 0
+    improved = True
+
+    while improved:
+        improved = False
+
+        order = list(range(nr_guests))
+        shuffle(order)
+
+        for guest_idx in order:
+            if max_moves is not None and nr_moves >= max_moves:
+                return
+
+            table_idx = assignment[guest_idx]
+
+            # Relationships of the guest with every guest
+            others, values = problem.neighbors(guest_idx + 1)
+            relationships = np.zeros(nr_guests, dtype = np.int64)
+            relationships[others - 1] = values
+
+            # Gain of swapping the guest with each other guest
+            gains = (affinity[guest_idx, assignment] - affinity[guest_idx, table_idx]
+                     + affinity[:, table_idx] - affinity[rows, assignment] - 2 * relationships)
+
+            same_table = assignment == table_idx
+            gains[same_table] = NO_SWAP
+
+            # Swaps evaluated: one with each guest of another table
+            problem.evaluations += nr_guests - int(same_table.sum())
+
+            other_idx = int(np.argmax(gains))
+
+            if gains[other_idx] > 0:
+                _swap(individual, affinity, assignment, guest_idx, other_idx)
+                nr_moves += 1
+                improved = True
+
+def _best_improvement(individual, affinity, assignment, max_moves):
+    """
+    Make the best swap over all pairs of guests while it improves the fitness
+    """
+    problem = individual.problem
+    guests = np.arange(1, problem.nr_guests + 1)
+    rows = np.arange(problem.nr_guests)
+
+    relationships = problem.relationships_between(guests, guests).astype(np.int64)
+
+    # Swaps evaluated at each step: pairs of guests of different tables (swaps keep
+    # the number of guests of each table)
+    table_sizes = np.bincount(assignment)
+    nr_swaps = (problem.nr_guests ** 2 - int((table_sizes ** 2).sum())) // 2
+
+    nr_moves = 0
+
+    while max_moves is None or nr_moves < max_moves:
+        # cross[g, h]: affinity of guest g with the table of guest h
+        cross = affinity[:, assignment]
+        own = affinity[rows, assignment]
+
+        gains = cross + cross.T - own[:, None] - own[None, :] - 2 * relationships
+        gains[assignment[:, None] == assignment[None, :]] = NO_SWAP
+
+        problem.evaluations += nr_swaps
+
+        guest_idx, other_idx = np.unravel_index(np.argmax(gains), gains.shape)
+
+        if gains[guest_idx, other_idx] <= 0:
+            return
+
+        _swap(individual, affinity, assignment, int(guest_idx), int(other_idx))
+        nr_moves += 1
+
+def _swap(individual, affinity, assignment, guest_idx, other_idx):
+    """
+    Swap two guests (indexed by guest - 1) of different tables in the individual and
+    update the affinity matrix with the relationships of their neighbors
+    """
+    problem = individual.problem
+
+    table_idx, other_table_idx = int(assignment[guest_idx]), int(assignment[other_idx])
+
+    individual.move_guest(guest_idx + 1, table_idx, other_table_idx)
+    individual.move_guest(other_idx + 1, other_table_idx, table_idx)
+
+    assignment[guest_idx], assignment[other_idx] = other_table_idx, table_idx
+
+    others, values = problem.neighbors(guest_idx + 1)
+    affinity[others - 1, table_idx] -= values
+    affinity[others - 1, other_table_idx] += values
+
+    others, values = problem.neighbors(other_idx + 1)
+    affinity[others - 1, other_table_idx] -= values
+    affinity[others - 1, table_idx] += values
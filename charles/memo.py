@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+
+class FitnessMemo:
+    """
+    Bounded LRU table from the canonical key of an arrangement (see
+    Individual.canonical_key) to the fitness of each of its tables, in the order
+    of the canonical labels of the tables (see batch_fitness in charles.py).
+
+    A memo is attached to a SeatingProblem (problem.memo), so it is shared by
+    every generation and every run on that problem in the same process.
+    Arrangements already seen are not evaluated again by batch_fitness.
+    """
+    def __init__(self, maxsize = 100000):
+        """
+        Args:
+            maxsize (int, optional): Maximum number of arrangements kept. The least
+                recently used ones are discarded first.
+        """
+        self.maxsize = maxsize
+
+        self._table = OrderedDict()
+
+        self.hits = 0
+
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._table)
+
+    def get(self, key):
+        """
+        Fitness of each table of an arrangement, or None if it is not in the table
+        """
+        table_fitness = self._table.get(key)
+
+        if table_fitness is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._table.move_to_end(key)
+
+        return table_fitness
+
+    def put(self, key, table_fitness):
+        """
+        Save the fitness of each table of an arrangement
+        """
+        self._table[key] = table_fitness
+        self._table.move_to_end(key)
+
+        if len(self._table) > self.maxsize:
+            self._table.popitem(last = False)
+
+    def hit_rate(self):
+        """
+        Fraction of lookups found in the table
+        """
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups > 0 else 0
+
+    def stats(self):
+        """
+        Hit and miss statistics
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate(),
+                'size': len(self._table), 'maxsize': self.maxsize}
+
+    def clear(self):
+        """
+        Empty the table and reset the statistics
+        """
+        self._table.clear()
+        self.hits = 0
+        self.misses = 0
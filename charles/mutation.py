@@ -1,4 +1,14 @@
+"""
+Mutation operators for WSC Individuals.
+
+All operators move guests through the Individual API (seat_guest, remove_guest,
+move_guest, seat_guests, remove_guests), which updates the cached fitness with
+the delta of each move instead of re-scoring the whole individual.
+"""
+
 from random import sample, choice, shuffle
+from collections import deque
+import numpy as np
 
 def swap_mutation(individual):
     """
@@ -16,12 +26,12 @@ def swap_mutation(individual):
     table_idx = sample(range(len(individual)), 2)
 
     # Get two guests from the tables
-    guest1 = individual[table_idx[0]].pop()
-    guest2 = individual[table_idx[1]].pop()
+    guest1 = next(iter(individual[table_idx[0]]))
+    guest2 = next(iter(individual[table_idx[1]]))
 
     # Swap
-    individual.seat_guest(guest2, table_idx[0])
-    individual.seat_guest(guest1, table_idx[1])
+    individual.move_guest(guest1, table_idx[0], table_idx[1])
+    individual.move_guest(guest2, table_idx[1], table_idx[0])
     
     return individual
 
@@ -45,12 +55,18 @@ def merge_and_split(individual):
     mixed_tables = individual[table_idx[0]] | individual[table_idx[1]]
 
     # Splits the merged table into two new tables
-    fst_table = sample(list(mixed_tables), len(individual[0]))
-    snd_table = [person for person in mixed_tables if person not in fst_table]
+    fst_table = set(sample(list(mixed_tables), len(individual[0])))
+
+    # Guests that change table
+    to_fst_table = fst_table - individual[table_idx[0]]
+    to_snd_table = individual[table_idx[0]] - fst_table
 
     # Updates the individual
-    individual[table_idx[0]]= set(fst_table)
-    individual[table_idx[1]] = set(snd_table)
+    for person in to_fst_table:
+        individual.move_guest(person, table_idx[1], table_idx[0])
+
+    for person in to_snd_table:
+        individual.move_guest(person, table_idx[0], table_idx[1])
 
     return individual
 
@@ -80,16 +96,12 @@ def the_hop(individual):
         # Choose a random person from the available guests in the current table
         random_person = choice(available_guests)
 
-        # Remove the random person from the current table
-        current_table.remove(random_person)
-
         # Add the random person to the moved guests list
         moved_guests.append(random_person)
 
-        # Move the random person to the next person
+        # Move the random person to the next table
         next_table_index = (i + 1) % len(individual)
-        next_table = individual[next_table_index]
-        next_table.add(random_person)
+        individual.move_guest(random_person, i, next_table_index)
 
     return individual
 
@@ -108,45 +120,74 @@ def dream_team(individual):
 
     seats_per_table = len(individual[0])
 
-    # List to save the guests to shuffle
-    guests_to_shuffle = []
+    # Guests of each table, in the order of the sets
+    tables = [list(table) for table in individual]
 
-    for table_idx in range(len(individual)):
+    # Guests with the highest relationship of each table
+    core = table_cores(individual.problem, tables)
 
-        # Dictionary to save the best relationship of each guest
-        table_best_relationships = {}
-    
-        for guest in individual[table_idx]:
-            table_best_relationships[guest] = individual.get_guest_max_relationship(guest, table_idx)
-
-        # Get the highest relationship value of the table
-        max_relationship = max(table_best_relationships.values())
+    # List to save the guests to shuffle
+    guests_to_shuffle = []
 
-        # Get all guests with worse highest relationship than max_relationship
-        guests_to_remove = [guest for guest in individual[table_idx] if table_best_relationships[guest] != max_relationship]
+    for table_idx, guests in enumerate(tables):
+        # Remove all other guests from the table and add them to be shuffled
+        guests_to_remove = [guest for guest, in_core in zip(guests, core[table_idx]) if not in_core]
 
-        # Add those guests to be shuffled
-        guests_to_shuffle = guests_to_shuffle + guests_to_remove
+        guests_to_shuffle.extend(guests_to_remove)
 
-        # Remove those guests from the table
-        for guest in guests_to_remove:
-            individual.remove_guest(guest, table_idx)
+        individual.remove_guests(guests_to_remove, table_idx)
 
     # Suffle guests
     shuffle(guests_to_shuffle)
 
+    guests_to_seat = deque(guests_to_shuffle)
+
     table_idx = 0
 
     # Seat guests in the suffled order
-    while len(guests_to_shuffle) > 0:
-        # Get the first guest left to seat
-        guest_to_seat = guests_to_shuffle.pop(0)
-        
+    while guests_to_seat:
         # Find the next table with available seats
         while len(individual[table_idx]) >= seats_per_table:
             table_idx += 1
 
-        # Seat the guest
-        individual.seat_guest(guest_to_seat, table_idx)
+        # Fill the table with the next guests left to seat
+        nr_seats = min(seats_per_table - len(individual[table_idx]), len(guests_to_seat))
+
+        individual.seat_guests([guests_to_seat.popleft() for _ in range(nr_seats)], table_idx)
+
+    return individual
+
+def table_cores(problem, tables):
+    """
+    Core of each table: the guests whose best relationship with the other guests
+    of the table is the highest relationship of the table
+
+    The relationships of all tables are read at once and the cores are found with
+    max operations over the table submatrices.
+
+    Args:
+        problem (SeatingProblem): Problem of the tables
+        tables (list of lists): Guests of each table
+
+    Returns:
+        core (np.ndarray of bool): Matrix of shape (nr_tables, max table size), True for the
+            guests of the core, in the order of the guests of each table
+    """
+    nr_seats = max(len(table) for table in tables)
+
+    # Guests of each table, 0 for the empty seats
+    guests = np.zeros((len(tables), nr_seats), dtype = np.intp)
+    for table_idx, table in enumerate(tables):
+        guests[table_idx, :len(table)] = table
+
+    seated = guests > 0
+
+    # Relationships between different guests of the same table
+    is_pair = seated[:, :, None] & seated[:, None, :] & ~np.eye(nr_seats, dtype = bool)
+    relationships = np.where(is_pair, problem.table_relationships(guests), np.iinfo(np.int64).min)
+
+    # Best relationship of each guest in its table and highest relationship of each table
+    best_relationships = relationships.max(axis = 2)
+    max_relationships = best_relationships.max(axis = 1)
 
-    return individual
\ No newline at end of file
+    return seated & (best_relationships == max_relationships[:, None])
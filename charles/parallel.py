@@ -0,0 +1,276 @@
+import os
+import random
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from charles.charles import Population, Individual, breed
+
+
+def task_seed(seed, key):
+    """
+    Deterministic seed of a task, derived from a base seed and the task key.
+
+    The seed only depends on the task itself (and not on the worker or the order
+    in which tasks are scheduled), so results are reproducible with any number
+    of workers.
+
+    Args:
+        seed (int): Base seed
+        key (tuple): Key that identifies the task, e.g. (combination name, run number)
+
+    Returns:
+        (int): Seed of the task
+    """
+    return zlib.crc32(repr((seed, key)).encode())
+
+def seed_rngs(seed):
+    """
+    Seed the random number generators used by the GA (random and numpy)
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+def _run_task(task):
+    """
+    Run a single task in a worker process
+    """
+    func, key, kwargs, seed = task
+
+    seed_rngs(task_seed(seed, key))
+
+    return func(**kwargs)
+
+def run_tasks(func, tasks, n_workers = None, seed = 0):
+    """
+    Run independent tasks in a pool of processes.
+
+    Args:
+        func (function): Top level function run by each task
+        tasks (list of tuples): List of (key, kwargs) where key identifies the task
+            and is used to seed it, and kwargs are the arguments of func
+        n_workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+            With 1 worker the tasks are run in the current process.
+        seed (int, optional): Base seed of the tasks
+
+    Returns:
+        results (list): Result of each task, in the same order as tasks
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+
+    jobs = [(func, key, kwargs, seed) for key, kwargs in tasks]
+
+    if n_workers == 1:
+        return [_run_task(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers = n_workers) as executor:
+        return list(executor.map(_run_task, jobs))
+
+def imap_tasks(func, tasks, n_workers = None, seed = 0):
+    """
+    Run independent tasks in a pool of processes, like run_tasks, and yield the
+    result of each task as soon as it finishes.
+
+    Yields:
+        key, result: Key and result of each task, in order of completion
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+
+    jobs = [(func, key, kwargs, seed) for key, kwargs in tasks]
+
+    if n_workers == 1:
+        for job in jobs:
+            yield job[1], _run_task(job)
+        return
+
+    with ProcessPoolExecutor(max_workers = n_workers) as executor:
+        futures = {executor.submit(_run_task, job): job[1] for job in jobs}
+
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def run_ga(pop_size, nr_guests = None, nr_tables = None, problem = None, return_timings = False,
+           checkpoint_path = None, **evolve_kwargs):
+    """
+    Create a population and evolve it. Used as the task of independent GA runs.
+
+    Args:
+        return_timings (bool, optional): Also return the time spent in the run
+        checkpoint_path (str, optional): File where the population is checkpointed during
+            the evolution (see Population.evolve). If it exists, the run is resumed from it.
+            It is removed when the run finishes.
+
+    Returns:
+        fitness_history (list of int): Best fitness of each generation
+        best_individual (Individual): Best individual of the last generation
+        timings (dict, only if return_timings is True): Wall-clock and CPU time (in seconds)
+            of the initialization of the population ('init_wall_time', 'init_cpu_time')
+            and of each generation ('wall_time', 'cpu_time'), and the reason why the
+            evolution stopped ('stop_reason', see Population.evolve)
+    """
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        pop = Population.load_checkpoint(checkpoint_path)
+
+        # Generations left to evolve
+        evolve_kwargs['n_generations'] -= len(pop.fitness_history)
+    else:
+        pop = Population(pop_size = pop_size, nr_guests = nr_guests, nr_tables = nr_tables, problem = problem)
+
+    _, best_individual = pop.evolve(checkpoint_path = checkpoint_path, **evolve_kwargs)
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    if not return_timings:
+        return pop.fitness_history, best_individual
+
+    timings = {'init_wall_time': pop.init_wall_time, 'init_cpu_time': pop.init_cpu_time,
+               'wall_time': pop.wall_time_history, 'cpu_time': pop.cpu_time_history,
+               'stop_reason': pop.stop_reason}
+
+    return pop.fitness_history, best_individual, timings
+
+
+# Problem held by each worker of an OffspringPool, set once when the worker starts
+_worker_problem = None
+
+def _init_offspring_worker(problem):
+    """
+    Initialize a worker of an OffspringPool
+    """
+    global _worker_problem
+    _worker_problem = problem
+
+def _to_compact(individual):
+    """
+    Compact representation of an offspring: assignment and fitness of each table
+    """
+    if individual is None:
+        return None
+
+    # Evaluate the offspring, counting it in the evaluations of the worker if needed
+    individual.get_fitness()
+
+    return individual.to_assignment(), [individual.get_table_fitness(table_idx) for table_idx in range(len(individual))]
+
+def _parent_to_compact(individual):
+    """
+    Compact representation of a parent: assignment and fitness of each table, or
+    None if it is not cached, so unchanged offspring are not evaluated again
+    """
+    table_fitness = individual._table_fitness
+
+    return individual.to_assignment(), None if None in table_fitness else list(table_fitness)
+
+def _breed_chunk(pairs, xo_prob, mut_prob, crossover, mutate, seeds):
+    """
+    Breed a chunk of pairs of parents in a worker of an OffspringPool.
+
+    Parents are received and offspring are returned in their compact representation,
+    together with the fitness of each table so it is not computed again, and the
+    number of fitness evaluations done by the worker (see SeatingProblem.evaluations).
+    """
+    evaluations_start = _worker_problem.evaluations
+
+    offspring = []
+
+    for ((assignment1, table_fitness1), (assignment2, table_fitness2)), seed in zip(pairs, seeds):
+        seed_rngs(seed)
+
+        p1 = Individual.from_assignment(assignment1, _worker_problem, table_fitness1)
+        p2 = Individual.from_assignment(assignment2, _worker_problem, table_fitness2)
+
+        offspring1, offspring2 = breed(p1, p2, xo_prob, mut_prob, crossover, mutate)
+
+        offspring.append((_to_compact(offspring1), _to_compact(offspring2)))
+
+    return offspring, _worker_problem.evaluations - evaluations_start
+
+class OffspringPool:
+    """
+    Persistent pool of processes that breed the offspring of a generation in parallel
+    (see Population.evolve).
+
+    Each worker receives the problem once, when it starts. Parents are sent
+    as compact guest to table assignments and the offspring come back the same way.
+    The pool can be used as a context manager and reused across generations and runs.
+    """
+    def __init__(self, problem, n_workers = None):
+        """
+        Start the worker processes
+
+        Args:
+            problem (SeatingProblem): Problem of the populations bred by the pool
+            n_workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        """
+        self.problem = problem
+
+        self.n_workers = n_workers if n_workers is not None else os.cpu_count()
+
+        self.executor = ProcessPoolExecutor(max_workers = self.n_workers, initializer = _init_offspring_worker,
+                                            initargs = (problem,))
+
+    def breed(self, pairs, xo_prob, mut_prob, crossover, mutate):
+        """
+        Breed pairs of parents in the worker processes.
+
+        The pairs are split in one chunk per worker. Each pair is seeded with a number
+        drawn from numpy's random generator, so results are reproducible for a given seed
+        and do not depend on the number of workers.
+
+        Args:
+            pairs (list of tuples of Individual): Pairs of parents
+            xo_prob, mut_prob, crossover, mutate: As in Population.evolve
+
+        Returns:
+            offspring (list of tuples of Individual): Offspring of each pair (the second one may be None)
+            evaluations (int): Number of fitness evaluations done by the workers
+        """
+        compact_pairs = [(_parent_to_compact(p1), _parent_to_compact(p2)) for p1, p2 in pairs]
+
+        seeds = np.random.randint(0, 2 ** 32, size = len(pairs), dtype = np.int64).tolist()
+
+        chunks = [chunk for chunk in np.array_split(np.arange(len(pairs)), self.n_workers) if len(chunk) > 0]
+
+        futures = [self.executor.submit(_breed_chunk, [compact_pairs[idx] for idx in chunk],
+                                        xo_prob, mut_prob, crossover, mutate, [seeds[idx] for idx in chunk])
+                   for chunk in chunks]
+
+        offspring = []
+        evaluations = 0
+
+        for future in futures:
+            chunk_offspring, chunk_evaluations = future.result()
+
+            for compact1, compact2 in chunk_offspring:
+                offspring.append((self._from_compact(compact1), self._from_compact(compact2)))
+
+            evaluations += chunk_evaluations
+
+        return offspring, evaluations
+
+    def _from_compact(self, compact):
+        """
+        Individual from the compact representation of an offspring (see _to_compact)
+        """
+        if compact is None:
+            return None
+
+        assignment, table_fitness = compact
+
+        return Individual.from_assignment(assignment, self.problem, table_fitness)
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
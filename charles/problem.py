@@ -0,0 +1,519 @@
+from functools import lru_cache
+
+import numpy as np
+
+# Maximum number of relationships read in a single batch by table_affinity
+AFFINITY_CELLS = 2 ** 20
+
+
+def narrowest_int_dtype(values):
+    """
+    Smallest signed integer dtype that holds all the given values
+    """
+    return np.result_type(np.min_scalar_type(-abs(int(values.min())) - 1),
+                          np.min_scalar_type(-abs(int(values.max())) - 1))
+
+def padded_matrix(relationships_matrix):
+    """
+    Relationship matrix in the form used by SeatingProblem: symmetric, indexed by guest
+    number (with an extra row and column of zeros for index 0) and with the narrowest
+    integer dtype
+
+    Each pair of guests is counted once, so the fitness must not depend on the order
+    in which the guests are visited: asymmetric matrices use the value above the
+    diagonal for both guests (the wedding data has two asymmetric pairs, (1, 54) and (2, 54)).
+
+    Args:
+        relationships_matrix (np.ndarray): Square matrix of relationships between guests
+
+    Returns:
+        (np.ndarray): Matrix of shape (nr_guests + 1, nr_guests + 1)
+    """
+    relationships_matrix = np.asarray(relationships_matrix)
+
+    symmetric = np.triu(relationships_matrix) + np.triu(relationships_matrix, 1).T
+
+    matrix = np.zeros((len(symmetric) + 1, len(symmetric) + 1), dtype = narrowest_int_dtype(symmetric))
+    matrix[1:, 1:] = symmetric
+
+    return matrix
+
+
+class SeatingProblem:
+    """
+    Instance of the Wedding Seating Chart problem: the relationships among
+    the guests and the tables where they are seated.
+
+    The problem is shared by the Population and all of its Individuals, so one
+    process can solve several instances at the same time.
+
+    Guests are numbered from 1 to nr_guests. The matrix has an extra row and column
+    of zeros for index 0, so the relationship between two guests is simply
+    matrix[guest, other_guest].
+
+    The GA reads the relationships through the methods of the problem
+    (relationships_between, affinity, ...), so other storage backends, such as
+    SparseSeatingProblem, can be used in its place.
+    """
+
+    # The relationships are stored in a dense matrix
+    sparse = False
+
+    def __init__(self, relationships_matrix, nr_tables, table_capacities = None, memo = None):
+        """
+        Initialize the problem and precompute the data derived from the relationship matrix
+
+        Args:
+            relationships_matrix (np.ndarray): Square matrix of relationships between guests.
+                Asymmetric entries use the value above the diagonal (see padded_matrix).
+            nr_tables (int): Number of tables
+            table_capacities (list of int, optional): Number of seats of each table, the same
+                for every table. Defaults to the guests split evenly among the tables.
+            memo (FitnessMemo, optional): Table of the fitness of the arrangements already
+                evaluated, shared by all populations of the problem (see charles/memo.py)
+        """
+        self._set_matrix(padded_matrix(relationships_matrix), nr_tables, table_capacities, memo)
+
+    @classmethod
+    def from_padded_matrix(cls, matrix, nr_tables, table_capacities = None, memo = None):
+        """
+        Create a problem from a matrix already in its final form (see padded_matrix).
+
+        The matrix is used as is, without a copy, so a memory-mapped matrix (see
+        data/relationships.py) shares its pages among all the processes that map it.
+        """
+        problem = cls.__new__(cls)
+
+        problem._set_matrix(matrix, nr_tables, table_capacities, memo)
+
+        return problem
+
+    def _set_matrix(self, matrix, nr_tables, table_capacities, memo):
+        """
+        Set the relationship matrix (see padded_matrix) and precompute the data derived from it
+        """
+        self._set_tables(len(matrix) - 1, nr_tables, table_capacities)
+
+        # Relationship matrix indexed by guest number (read-only view)
+        self.matrix = matrix.view()
+        self.matrix.flags.writeable = False
+
+        self.memo = memo
+
+        # Number of arrangements whose fitness was computed from scratch in this process
+        # (cached fitness, memo hits and delta updates are not counted), plus the swaps
+        # evaluated by a local search (see charles/local_search.py)
+        self.evaluations = 0
+
+    def _set_tables(self, nr_guests, nr_tables, table_capacities):
+        """
+        Set the number of guests and the tables, checking that the capacities seat every guest
+        """
+        self.nr_guests = nr_guests
+
+        self.nr_tables = nr_tables
+
+        # The operators take the size of the first table as the size of every table
+        if self.nr_guests % nr_tables != 0:
+            raise ValueError('The number of guests must be a multiple of the number of tables')
+
+        if table_capacities is None:
+            table_capacities = [self.nr_guests // nr_tables] * nr_tables
+
+        if len(table_capacities) != nr_tables or sum(table_capacities) != self.nr_guests:
+            raise ValueError('Table capacities must have one entry per table and seat every guest')
+
+        if len(set(table_capacities)) > 1:
+            raise ValueError('Every table must have the same capacity')
+
+        self.table_capacities = list(table_capacities)
+
+        self.guests_per_table = self.table_capacities[0]
+
+    # ---------------------------- Relationship access ---------------------------- #
+    # Guests are given by their number and lists of guests must not have repetitions
+
+    def relationships_between(self, guests, other_guests):
+        """
+        Relationships between two lists of guests
+
+        Returns:
+            (np.ndarray): Matrix of shape (len(guests), len(other_guests))
+        """
+        return self.matrix[np.asarray(guests, dtype = np.intp)[:, None], np.asarray(other_guests, dtype = np.intp)]
+
+    def affinity(self, guests, other_guests):
+        """
+        Sum of the relationships of each guest with the other guests
+
+        Returns:
+            (np.ndarray of int64): One sum per guest
+        """
+        return self.relationships_between(guests, other_guests).sum(axis = 1, dtype = np.int64)
+
+    def guest_affinity(self, guest, other_guests):
+        """
+        Sum of the relationships of a guest with the other guests
+        """
+        return int(self.matrix[guest, other_guests].sum())
+
+    def table_affinity(self, guests, assignment, nr_tables):
+        """
+        Sum of the relationships of each guest with the guests seated at each table
+
+        Args:
+            guests (array-like of int): Guest numbers
+            assignment (np.ndarray): Table of each guest (see tables_to_assignment), -1 if not seated
+            nr_tables (int): Number of tables
+
+        Returns:
+            (np.ndarray of int64): Matrix of shape (len(guests), nr_tables)
+        """
+        assignment = np.asarray(assignment)
+
+        # Seated guests grouped by table and number of guests of each table
+        seated = np.flatnonzero(assignment >= 0)
+        order = seated[np.argsort(assignment[seated], kind = 'stable')]
+        table_sizes = np.bincount(assignment[seated], minlength = nr_tables)
+        table_starts = np.cumsum(table_sizes) - table_sizes
+
+        guests = np.asarray(guests, dtype = np.intp)
+
+        affinity = np.zeros((len(guests), nr_tables), dtype = np.int64)
+
+        # Sum of the relationships with the guests of each table that has guests. The rows
+        # are read in chunks, so the int64 sums never hold more than AFFINITY_CELLS values
+        occupied = np.flatnonzero(table_sizes)
+
+        if len(occupied) == 0:
+            return affinity
+
+        chunk_size = max(1, AFFINITY_CELLS // len(order))
+
+        for start in range(0, len(guests), chunk_size):
+            relationships = self.matrix[guests[start:start + chunk_size, None], order + 1]
+
+            affinity[start:start + chunk_size, occupied] = np.add.reduceat(relationships, table_starts[occupied],
+                                                                           axis = 1, dtype = np.int64)
+
+        return affinity
+
+    def table_relationships(self, tables):
+        """
+        Relationships among the guests of each table
+
+        Args:
+            tables (np.ndarray): Matrix of shape (nr_tables, seats) with the guests of each
+                table, 0 for the empty seats
+
+        Returns:
+            (np.ndarray): Array of shape (nr_tables, seats, seats), 0 for the empty seats
+        """
+        return self.matrix[tables[:, :, None], tables[:, None, :]]
+
+    def guest_relationships(self, guest, other_guests):
+        """
+        Relationships of a guest with each of the other guests
+        """
+        return self.matrix[guest, other_guests]
+
+    def table_fitness(self, guests):
+        """
+        Sum of the relationships between every pair of guests seated together
+        """
+        # The matrix is symmetric with a zero diagonal, so each pair is counted twice
+        return int(self.relationships_between(guests, guests).sum()) // 2
+
+    def neighbors(self, guest):
+        """
+        Guests with whom a guest has a relationship (other than 0)
+
+        Returns:
+            other_guests (np.ndarray): Numbers of the guests
+            values (np.ndarray): Relationship with each of them
+        """
+        row = self.matrix[guest]
+        other_guests = np.flatnonzero(row)
+
+        return other_guests, row[other_guests]
+
+    @property
+    def guests(self):
+        """
+        Guest numbers
+        """
+        return range(1, self.nr_guests + 1)
+
+    def __deepcopy__(self, memo):
+        """
+        The problem is read-only, so copies of Individuals share it
+        """
+        return self
+
+    def __copy__(self):
+        return self
+
+    @classmethod
+    def from_excel(cls, path, nr_tables, table_capacities = None):
+        """
+        Create a problem from a relationships spreadsheet (see data/relationships.py)
+        """
+        from data import relationships
+
+        return cls.from_padded_matrix(relationships.load_padded_matrix(path), nr_tables, table_capacities)
+
+
+class SparseSeatingProblem(SeatingProblem):
+    """
+    Instance of the Wedding Seating Chart problem that only stores the pairs of
+    guests that have a relationship (other than 0), for events where almost all
+    guests are strangers.
+
+    The relationships are kept as adjacency lists in CSR form: the other guests
+    and the values of the relationships of guest g are indices[indptr[g]:indptr[g + 1]]
+    and data[indptr[g]:indptr[g + 1]], sorted by guest number. Memory is proportional
+    to the number of relationships and the work done for a guest to its number of
+    relationships, instead of to the number of guests.
+    """
+
+    # The relationships are stored as adjacency lists
+    sparse = True
+
+    def __init__(self, relationships_matrix, nr_tables, table_capacities = None, memo = None):
+        """
+        Initialize the problem from a dense relationship matrix (see SeatingProblem).
+        Use from_edges to create it without building the dense matrix.
+        """
+        relationships_matrix = np.asarray(relationships_matrix)
+
+        # Pairs above the diagonal, as in SeatingProblem
+        guests, other_guests = np.nonzero(np.triu(relationships_matrix, 1))
+
+        self._build(len(relationships_matrix), guests + 1, other_guests + 1,
+                    relationships_matrix[guests, other_guests], nr_tables, table_capacities, memo)
+
+    @classmethod
+    def from_padded_matrix(cls, matrix, nr_tables, table_capacities = None, memo = None):
+        """
+        Create a problem from a matrix in the form of SeatingProblem.matrix. The adjacency
+        lists are built from it, so the matrix itself is not kept.
+        """
+        return cls(matrix[1:, 1:], nr_tables, table_capacities, memo)
+
+    @classmethod
+    def from_edges(cls, nr_guests, guests, other_guests, values, nr_tables, table_capacities = None, memo = None):
+        """
+        Create a problem from its pairs of guests with a relationship
+
+        Each pair is given once, in any order. If a pair is given in both orders, the
+        value given with guest < other_guest is used, as in SeatingProblem.
+
+        Args:
+            nr_guests (int): Number of guests
+            guests, other_guests (array-like of int): Guest numbers (from 1) of each pair
+            values (array-like of int): Relationship of each pair
+            nr_tables, table_capacities, memo: As in SeatingProblem
+        """
+        problem = cls.__new__(cls)
+
+        problem._build(nr_guests, guests, other_guests, values, nr_tables, table_capacities, memo)
+
+        return problem
+
+    def _build(self, nr_guests, guests, other_guests, values, nr_tables, table_capacities, memo):
+        """
+        Build the adjacency lists and the data derived from them
+        """
+        self._set_tables(nr_guests, nr_tables, table_capacities)
+
+        guests = np.asarray(guests, dtype = np.int64)
+        other_guests = np.asarray(other_guests, dtype = np.int64)
+        values = np.asarray(values)
+
+        # Pairs of different guests with a relationship, as (lower, higher) guest number
+        keep = (guests != other_guests) & (values != 0)
+        guests, other_guests, values = guests[keep], other_guests[keep], values[keep]
+
+        lower = np.minimum(guests, other_guests)
+        higher = np.maximum(guests, other_guests)
+
+        # One value per pair, preferring the one given with guest < other_guest
+        order = np.lexsort((guests > other_guests, higher, lower))
+        pair_keys = lower[order] * (nr_guests + 1) + higher[order]
+        first = np.ones(len(order), dtype = bool)
+        first[1:] = pair_keys[1:] != pair_keys[:-1]
+        order = order[first]
+
+        dtype = narrowest_int_dtype(values) if len(values) > 0 else np.int8
+
+        # Each pair once (lower < higher), used by the vectorized evaluation
+        self.edge_guests = lower[order]
+        self.edge_other_guests = higher[order]
+        self.edge_values = values[order].astype(dtype)
+
+        # Adjacency lists, with each pair in both directions and sorted by guest and other guest
+        rows = np.concatenate((self.edge_guests, self.edge_other_guests))
+        columns = np.concatenate((self.edge_other_guests, self.edge_guests))
+        data = np.concatenate((self.edge_values, self.edge_values))
+
+        order = np.lexsort((columns, rows))
+
+        self.indptr = np.zeros(nr_guests + 2, dtype = np.int64)
+        self.indptr[1:] = np.cumsum(np.bincount(rows, minlength = nr_guests + 1))
+        self.indices = columns[order]
+        self.data = data[order]
+
+        for array in (self.indptr, self.indices, self.data, self.edge_guests, self.edge_other_guests, self.edge_values):
+            array.flags.writeable = False
+
+        self.memo = memo
+
+        self.evaluations = 0
+
+    def _rows(self, guests):
+        """
+        Relationships of several guests
+
+        Returns:
+            positions (np.ndarray): Position in guests of the guest of each relationship
+            other_guests (np.ndarray): Other guest of each relationship
+            values (np.ndarray): Value of each relationship
+        """
+        guests = np.asarray(guests, dtype = np.intp)
+
+        starts = self.indptr[guests]
+        lengths = self.indptr[guests + 1] - starts
+
+        positions = np.repeat(np.arange(len(guests)), lengths)
+
+        # Offset of each relationship in indices and data
+        offsets = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+
+        return positions, self.indices[offsets], self.data[offsets]
+
+    @staticmethod
+    def _find(other_guests, guests):
+        """
+        Position of each of the guests in other_guests
+
+        Returns:
+            positions (np.ndarray): Position in other_guests of each guest (meaningless if not found)
+            found (np.ndarray of bool): Whether each guest is in other_guests
+        """
+        other_guests = np.asarray(other_guests, dtype = np.intp)
+
+        if len(other_guests) == 0:
+            return np.zeros(len(guests), dtype = np.intp), np.zeros(len(guests), dtype = bool)
+
+        order = np.argsort(other_guests)
+        sorted_guests = other_guests[order]
+
+        positions = np.minimum(np.searchsorted(sorted_guests, guests), len(other_guests) - 1)
+
+        return order[positions], sorted_guests[positions] == guests
+
+    def relationships_between(self, guests, other_guests):
+        relationships = np.zeros((len(guests), len(other_guests)), dtype = self.data.dtype)
+
+        positions, row_guests, values = self._rows(guests)
+        columns, found = self._find(other_guests, row_guests)
+
+        relationships[positions[found], columns[found]] = values[found]
+
+        return relationships
+
+    def affinity(self, guests, other_guests):
+        positions, row_guests, values = self._rows(guests)
+        _, found = self._find(other_guests, row_guests)
+
+        return np.bincount(positions[found], weights = values[found], minlength = len(guests)).astype(np.int64)
+
+    def table_relationships(self, tables):
+        nr_seats = tables.shape[1]
+
+        # Seat (position in the flattened tables) of each guest, -1 if not seated
+        seats = np.flatnonzero(tables)
+        guests = tables.ravel()[seats]
+        seat_of = np.full(self.nr_guests + 1, -1, dtype = np.int64)
+        seat_of[guests] = seats
+
+        positions, row_guests, values = self._rows(guests)
+
+        # Relationships between guests seated at the same table
+        seat, other_seat = seats[positions], seat_of[row_guests]
+        same_table = (other_seat >= 0) & (other_seat // nr_seats == seat // nr_seats)
+
+        relationships = np.zeros((tables.size, nr_seats), dtype = self.data.dtype)
+        relationships[seat[same_table], other_seat[same_table] % nr_seats] = values[same_table]
+
+        return relationships.reshape(tables.shape[0], nr_seats, nr_seats)
+
+    def guest_relationships(self, guest, other_guests):
+        start, end = self.indptr[guest], self.indptr[guest + 1]
+
+        other_guests = np.asarray(other_guests, dtype = np.intp)
+        relationships = np.zeros(len(other_guests), dtype = self.data.dtype)
+
+        if end > start:
+            # The relationships of a guest are sorted by the number of the other guest
+            row_guests = self.indices[start:end]
+            positions = np.minimum(np.searchsorted(row_guests, other_guests), end - start - 1)
+            found = row_guests[positions] == other_guests
+
+            relationships[found] = self.data[start:end][positions[found]]
+
+        return relationships
+
+    def guest_affinity(self, guest, other_guests):
+        return int(self.guest_relationships(guest, other_guests).sum())
+
+    def table_affinity(self, guests, assignment, nr_tables):
+        positions, row_guests, values = self._rows(guests)
+
+        # Table of the other guest of each relationship
+        tables = assignment[row_guests - 1].astype(np.int64)
+        seated = tables >= 0
+
+        sums = np.bincount(positions[seated] * nr_tables + tables[seated], weights = values[seated],
+                           minlength = len(guests) * nr_tables)
+
+        return np.rint(sums).astype(np.int64).reshape(len(guests), nr_tables)
+
+    def table_fitness(self, guests):
+        # Each pair is counted twice, once for each guest
+        return int(self.affinity(guests, guests).sum()) // 2
+
+    def neighbors(self, guest):
+        start, end = self.indptr[guest], self.indptr[guest + 1]
+
+        return self.indices[start:end], self.data[start:end]
+
+
+def default_problem(nr_guests = None, nr_tables = None):
+    """
+    Problem of the wedding in data/seating_data.xlsx, restricted to the first nr_guests
+    guests (all by default), with nr_tables tables (8 by default).
+
+    The problem is created once per process for each number of guests and tables.
+    """
+    from data import relationships
+
+    if nr_guests is None:
+        nr_guests = len(relationships.relationships_matrix)
+
+    if nr_tables is None:
+        nr_tables = 8
+
+    return _default_problem(nr_guests, nr_tables)
+
+@lru_cache(maxsize = None)
+def _default_problem(nr_guests, nr_tables):
+    """
+    Create the default problem (see default_problem)
+    """
+    from data import relationships
+
+    # The padded matrix of the wedding is memory-mapped, so processes share it
+    matrix = relationships.load_padded_matrix()
+
+    return SeatingProblem.from_padded_matrix(matrix[:nr_guests + 1, :nr_guests + 1], nr_tables)
@@ -1,4 +1,80 @@
-from random import choice, uniform, choices
+import numpy as np
+
+# ------------------------------- Batched selection ------------------------------- #
+# Each function receives the fitness array of the population and returns the
+# indexes of n selected individuals at once.
+
+def fps_batch(fitnesses, n):
+    """
+    Fitness proportionate selection of n individuals.
+
+    Each individual occupies a segment of the line [0, total fitness] as long as its
+    fitness. n marks are drawn on the line and the owners of the segments are found
+    with a binary search over the cumulative fitness.
+
+    Args:
+        fitnesses (np.ndarray): Fitness of each individual of the population.
+        n (int): Number of individuals to select.
+
+    Returns:
+        np.ndarray: indexes of the selected individuals.
+    """
+    cumulative_fitness = np.cumsum(fitnesses)
+
+    # get random numbers between 0 and total fitness (marks on the line)
+    marks = np.random.uniform(0, cumulative_fitness[-1], n)
+
+    # find individuals that have the marks
+    return np.minimum(np.searchsorted(cumulative_fitness, marks), len(fitnesses) - 1)
+
+def ranking_selection_batch(fitnesses, n):
+    """
+    Ranking selection of n individuals.
+
+    The population is sorted once and the selection probability of each rank
+    is 1 - rank / sum(ranks), as in ranking_selection.
+
+    Args:
+        fitnesses (np.ndarray): Fitness of each individual of the population.
+        n (int): Number of individuals to select.
+
+    Returns:
+        np.ndarray: indexes of the selected individuals.
+    """
+    sorted_population = np.argsort(-fitnesses, kind = 'stable')
+
+    ranks = np.arange(1, len(fitnesses) + 1)
+
+    selection_probs = 1 - ranks / ranks.sum()
+
+    cumulative_probs = np.cumsum(selection_probs)
+
+    marks = np.random.uniform(0, cumulative_probs[-1], n)
+
+    return sorted_population[np.minimum(np.searchsorted(cumulative_probs, marks, side = 'right'), len(fitnesses) - 1)]
+
+def tournament_selection_batch(fitnesses, n, tournament_size = 4):
+    """
+    Tournament selection of n individuals: n tournaments are drawn at once.
+
+    Args:
+        fitnesses (np.ndarray): Fitness of each individual of the population.
+        n (int): Number of individuals to select.
+        tournament_size (int, optional): Size of the tournament.
+
+    Returns:
+        np.ndarray: indexes of the selected individuals.
+    """
+    tournaments = np.random.randint(0, len(fitnesses), size = (n, tournament_size))
+
+    winners = np.argmax(fitnesses[tournaments], axis = 1)
+
+    return tournaments[np.arange(n), winners]
+
+# ------------------------------ Per-call selection ------------------------------- #
+# Each function selects one individual from the population. The batched version
+# is attached as the `batch` attribute, so Population.evolve can draw all the
+# parents of a generation in one call.
 
 def fps(population):
     """
@@ -10,39 +86,19 @@ def fps(population):
     Returns:
         Individual: selected individual.
     """
-    # sum total fitness
-    total_fitness = sum([i.get_fitness() for i in population])
-
-    # get a random number between 0 and total fitness (mark on the line)
-    mark = uniform(0, total_fitness)
-
-    position = 0
+    return population[fps_batch(population.get_fitnesses(), 1)[0]]
 
-    # find individual that has mark
-    for i in population:
-        position += i.get_fitness()
-        if position >= mark:
-            return i
-    
 def ranking_selection(population):
     """
     Ranking selection implementation.
 
     Args:
         population (Population): The population we want to select from.
-    
+
     Returns:
         Individual: selected individual.
     """
-    sorted_population = sorted(population, key = lambda ind: ind.get_fitness(), reverse = True)
-
-    ranks = range(1, len(sorted_population) + 1)
-
-    selection_probs = [1 - (rank / sum(ranks)) for rank in ranks]
-
-    selected_individual = choices(sorted_population, weights = selection_probs, k = 1)[0]
-
-    return selected_individual
+    return population[ranking_selection_batch(population.get_fitnesses(), 1)[0]]
 
 def tournament_selection(population, tournament_size = 4):
     """
@@ -55,7 +111,8 @@ def tournament_selection(population, tournament_size = 4):
     Returns:
         Individual: selected individual.
     """
-    
-    tournament = [choice(population.get_individuals()) for _ in range(tournament_size)]
+    return population[tournament_selection_batch(population.get_fitnesses(), 1, tournament_size)[0]]
 
-    return max(tournament, key = lambda x: x.get_fitness())
\ No newline at end of file
+fps.batch = fps_batch
+ranking_selection.batch = ranking_selection_batch
+tournament_selection.batch = tournament_selection_batch
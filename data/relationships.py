@@ -1,14 +1,122 @@
-import pandas as pd
+import hashlib
 import os
 
+import numpy as np
+
 # Get the current directory of the script
 script_directory = os.path.dirname(os.path.abspath(__file__))
 
 # Construct the path to the file within the same folder
 file_path = os.path.join(script_directory, "seating_data.xlsx")
 
-relationships = pd.read_excel(file_path)
+# Folder where the parsed matrices are cached
+cache_directory = os.path.join(script_directory, "cache")
+
+# Matrices already loaded in this process, by source file
+_loaded_matrices = {}
+
+
+def file_hash(path):
+    """
+    SHA-256 hash of the contents of a file
+    """
+    sha256 = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+def parse_relationships(path):
+    """
+    Parse the relationship matrix from the excel file
+    """
+    # Only needed when the cache is built
+    import pandas as pd
+
+    relationships = pd.read_excel(path)
+
+    relationships.drop('idx', axis = 1, inplace = True)
+
+    return relationships.to_numpy()
+
+def load_relationships_matrix(path = file_path):
+    """
+    Load the relationship matrix of an excel file.
+
+    The first time a file is loaded, it is parsed and saved as a .npy file keyed by
+    the hash of its contents, so changes to the spreadsheet create a new cache entry.
+    Later loads memory-map the cached file read-only, which is fast and lets many
+    processes share the same pages of the matrix.
+
+    Args:
+        path (str, optional): Path to the excel file. Defaults to seating_data.xlsx.
+
+    Returns:
+        (np.ndarray): Read-only relationship matrix
+    """
+    return _load_cached(path, '', lambda: parse_relationships(path))
+
+def load_padded_matrix(path = file_path):
+    """
+    Relationship matrix of an excel file in the form used by SeatingProblem: symmetric
+    and with an extra row and column of zeros (see padded_matrix in charles/problem.py).
+
+    It is built once and cached next to the parsed matrix, so SeatingProblem.from_padded_matrix
+    uses the read-only mapping directly and processes do not build their own copy.
+
+    Args:
+        path (str, optional): Path to the excel file. Defaults to seating_data.xlsx.
+
+    Returns:
+        (np.ndarray): Read-only padded relationship matrix
+    """
+    from charles.problem import padded_matrix
+
+    return _load_cached(path, '_padded', lambda: padded_matrix(get_relationships_matrix(path)))
+
+def _load_cached(path, suffix, build):
+    """
+    Memory-map (read-only) the cached matrix of an excel file, building it the first time
+
+    Args:
+        path (str): Path to the excel file
+        suffix (str): Suffix of the name of the cache file, one per kind of matrix
+        build (function): Function that builds the matrix when it is not cached
+
+    Returns:
+        (np.ndarray): Read-only matrix
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_directory, f'{name}_{file_hash(path)[:16]}{suffix}.npy')
+
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_directory, exist_ok = True)
+
+        # Write to a temporary file and rename it, so that concurrent processes
+        # never read a partially written cache
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.save(file, build())
+        os.replace(temporary_path, cache_path)
+
+    return np.load(cache_path, mmap_mode = 'r')
+
+def get_relationships_matrix(path = file_path):
+    """
+    Relationship matrix of an excel file, loaded once per process
+    """
+    if path not in _loaded_matrices:
+        _loaded_matrices[path] = load_relationships_matrix(path)
+
+    return _loaded_matrices[path]
 
-relationships.drop('idx', axis = 1, inplace = True)
+def __getattr__(name):
+    """
+    Load relationships_matrix lazily, on first access
+    """
+    if name == 'relationships_matrix':
+        return get_relationships_matrix()
 
-relationships_matrix = relationships.to_numpy()
\ No newline at end of file
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -3,17 +3,36 @@ This file contains a script to perform a Grid Search over crossover,
 mutation and elitism operators of group genetic algorithm for the
 Wedding Seating Chart Problem. The results of the Grid Search are
 analyzed in the notebook results/experimental_analysis.ipynb.
+
+The results are saved as a result set in results/new_grid_search (see
+results_store.py), apart from the original results in results/grid_search
+that the notebook analyzes: the best fitness of each generation and the wall-clock and
+CPU time elapsed since the start of each run at the end of every generation,
+so the combinations can also be compared by their cost (see analyze_times).
+
+Each run is appended to results/new_grid_search/runs.jsonl as soon as it finishes
+and is then recorded in results/new_grid_search/manifest.jsonl, and every run checkpoints its population
+periodically, so an interrupted Grid Search can be resumed with --resume
+without repeating the finished work.
+
+Usage:
+    python grid_search.py              # Run the Grid Search
+    python grid_search.py --resume     # Resume an interrupted Grid Search
+    python grid_search.py --analyze    # Rank the combinations by time-to-target and fitness per second
+    python grid_search.py --analyze --directory results/grid_search    # Rank the original results
 """
 
-from charles.charles import Population
+from charles.parallel import imap_tasks, run_ga
 from charles.selection import tournament_selection
 from charles.crossover import gbx_crossover, eager_breeder_crossover, twin_maker
 from charles.mutation import swap_mutation, merge_and_split, the_hop, dream_team
+from results_store import save_results, load_results
 
 from itertools import product
+import argparse
+import os
 import pandas as pd
 import numpy as np
-import csv
 import json
 
 # --------------------- Hyperparameters to tune -------------------- #
@@ -33,62 +52,310 @@ nr_runs = 30
 n_generations = 100
 pop_size = 50
 
+# Early stopping: number of generations without improvement after which a run stops
+# (None runs all the generations). The best fitness and the elapsed time of a stopped
+# run are repeated in the remaining generations of the result files
+stagnation = None
+
 # Problem specific
 nr_guests = 64
 nr_tables = 8
 
-def grid_search(selection, crossover, mutation, elitism):
+# Result set of the Grid Search (the original results are in results/grid_search)
+results_directory = 'results/new_grid_search'
+
+# Streamed results of each run, completed runs and checkpoints of the runs in progress
+runs_file = os.path.join(results_directory, 'runs.jsonl')
+manifest_file = os.path.join(results_directory, 'manifest.jsonl')
+checkpoint_directory = 'results/checkpoints'
+checkpoint_interval = 10
+
+def grid_search(selection, crossover, mutation, elitism, n_workers = None, seed = 0, resume = False):
     """
     This function performs a Grid Search over crossover, mutation and elitism
 
     Each algorithm is run 30 times and the fitness of each generation is saved.
 
     The algorithms with average best fitness on the last generation will be
-    later analysed and compared.
+    later analysed and compared. The wall-clock and CPU time elapsed since the
+    start of each run (initialization included) are saved at the end of every
+    generation in the same format.
+
+    All (combination, run) pairs are independent and are distributed over
+    n_workers processes (all CPUs by default). Each run is seeded from seed,
+    the combination name and the run number, so results do not depend on
+    the scheduling.
+
+    Each run is saved as soon as it finishes (see append_run). With resume, the
+    runs in the manifest are skipped and the runs in progress continue from their
+    last checkpoint.
 
     """
 
+    completed = read_manifest()
+
+    if len(completed) > 0 and not resume:
+        raise FileExistsError(f'{manifest_file} already has completed runs: '
+                              'use --resume or remove the streamed results to start again')
+
+    os.makedirs(results_directory, exist_ok = True)
+    os.makedirs(checkpoint_directory, exist_ok = True)
+
     # Generate all combinations of GO and Elite Hyperparameters
     hyperparameters_search = list(product(selection, crossover, mutation, elitism))
 
-    # This dataframe will save the best fitness of each generation, for every combination
-    # of hyperparameters at each run. The columns are the combinations of hyperparameters
-    # and the rows are the generations. Each cell is a list of the best fitnesses of the
-    # corresponding combination and generation.
-    results = pd.DataFrame()
+    # Build one task per combination and run
+    tasks = []
+    combination_names = []
 
-    # For each combination of hyperparameters
     for (selection, crossover, mutation, elitism) in hyperparameters_search:
         
         # Save the name of the combination
         combination_name = f'{crossover.__name__}|{mutation.__name__}|elitism_{elitism}'
-        
-        # Save results of each run
-        comb_results = []
+        combination_names.append(combination_name)
 
         for run_nr in range(nr_runs):
-            print(f'----------- Run_{run_nr + 1} of comb {combination_name}')
+            # Skip the runs already completed
+            if (combination_name, run_nr) in completed:
+                continue
 
-            # Create a population
-            pop = Population(pop_size = pop_size, nr_guests = nr_guests, nr_tables = nr_tables)
+            checkpoint_path = os.path.join(checkpoint_directory, f'{combination_name.replace("|", "-")}_{run_nr}.pkl')
 
-            # Evolve the population
-            fitness_history, _ = pop.evolve(n_generations = n_generations, xo_prob = xo_prob,
-                                        mut_prob = mut_prob, select = selection, mutate = mutation,
-                                        crossover = crossover, elitism = elitism, elite_size = elite_size)
-        
-            comb_results.append(fitness_history)
-        
-        # Save results of the combination in the N runs
-        results[combination_name] = list(np.transpose(comb_results))
+            tasks.append(((combination_name, run_nr),
+                          dict(pop_size = pop_size, nr_guests = nr_guests, nr_tables = nr_tables,
+                               n_generations = n_generations, xo_prob = xo_prob,
+                               mut_prob = mut_prob, select = selection, mutate = mutation,
+                               crossover = crossover, elitism = elitism, elite_size = elite_size,
+                               stagnation = stagnation, verbose = False, return_timings = True,
+                               checkpoint_path = checkpoint_path, checkpoint_interval = checkpoint_interval)))
+
+    print(f'{len(completed)} runs already completed, {len(tasks)} runs to go')
 
-    # Formatting
-    results = results.applymap(lambda x: json.dumps(x.tolist()) if isinstance(x, np.ndarray) else x)
+    # Run all tasks in parallel, saving each run as soon as it finishes
+    for (combination_name, run_nr), (fitness_history, best_individual, timings) in \
+            imap_tasks(run_ga, tasks, n_workers = n_workers, seed = seed):
+        append_run(combination_name, run_nr, fitness_history, best_individual, timings)
+
+    # Arrays (combinations x runs x generations) of the fitness and the elapsed times
+    runs = read_runs()
+
+    shape = (len(combination_names), nr_runs, n_generations)
+    fitness = np.empty(shape, dtype = np.int64)
+    wall_time = np.empty(shape)
+    cpu_time = np.empty(shape)
+
+    stop_reasons = []
+
+    for combination_idx, combination_name in enumerate(combination_names):
+        stop_reasons.append([])
+
+        for run_nr in range(nr_runs):
+            run = runs[(combination_name, run_nr)]
+
+            # Runs stopped early are padded with their last value
+            padding = (0, n_generations - len(run['fitness']))
+
+            fitness[combination_idx, run_nr] = np.pad(run['fitness'], padding, mode = 'edge')
+            wall_time[combination_idx, run_nr] = np.pad(run['wall_time'], padding, mode = 'edge')
+            cpu_time[combination_idx, run_nr] = np.pad(run['cpu_time'], padding, mode = 'edge')
+
+            stop_reasons[-1].append(run['stop_reason'])
 
     # Save results to file
-    results.to_csv('results/results.csv', quoting=csv.QUOTE_NONNUMERIC, index=False)
+    save_results(results_directory, combination_names, fitness, wall_time, cpu_time,
+                 stop_reasons = stop_reasons, seed = seed, pop_size = pop_size, elite_size = elite_size,
+                 xo_prob = xo_prob, mut_prob = mut_prob, nr_guests = nr_guests, nr_tables = nr_tables)
+
+def _append_line(path, record):
+    """
+    Append a JSON record to a file and flush it to disk
+    """
+    with open(path, 'a+b') as file:
+        # Start a new line if the last one was truncated by a crash
+        if file.tell() > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b'\n':
+                file.write(b'\n')
+
+        file.write((json.dumps(record) + '\n').encode())
+        file.flush()
+        os.fsync(file.fileno())
+
+def _read_lines(path):
+    """
+    JSON records of a file. A truncated last line (from a crash while writing) is ignored
+    """
+    if not os.path.exists(path):
+        return []
+
+    records = []
+
+    with open(path) as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    return records
+
+def append_run(combination_name, run_nr, fitness_history, best_individual, timings):
+    """
+    Save a finished run: its results are appended to the runs file and then the run
+    is recorded in the manifest, so a run is only in the manifest once its results
+    are on disk. The elapsed times are saved since the start of the run, at the end
+    of each generation.
+    """
+    _append_line(runs_file, {'combination': combination_name, 'run': run_nr,
+                             'fitness': fitness_history,
+                             'wall_time': (timings['init_wall_time'] + np.cumsum(timings['wall_time'])).tolist(),
+                             'cpu_time': (timings['init_cpu_time'] + np.cumsum(timings['cpu_time'])).tolist(),
+                             'stop_reason': timings['stop_reason'],
+                             'best_fitness': best_individual.get_fitness(),
+                             'best_assignment': best_individual.to_assignment().tolist()})
+
+    _append_line(manifest_file, {'combination': combination_name, 'run': run_nr})
+
+def read_manifest():
+    """
+    Completed runs
+
+    Returns:
+        (set of tuples): (combination name, run number) of each completed run
+    """
+    return {(record['combination'], record['run']) for record in _read_lines(manifest_file)}
+
+def read_runs():
+    """
+    Results of the completed runs
+
+    Returns:
+        (dict): Record of each run saved by append_run, by (combination name, run number)
+    """
+    completed = read_manifest()
+
+    # A run interrupted between the two writes of append_run is saved twice; the last one is kept
+    return {(record['combination'], record['run']): record for record in _read_lines(runs_file)
+            if (record['combination'], record['run']) in completed}
+
+def analyze_times(target = None, time_budget = None, cpu = False, directory = results_directory):
+    """
+    Rank the combinations of the Grid Search by their cost.
+
+    For each combination the following are computed over the runs:
+        - success_rate: fraction of runs that reached the target fitness
+        - time_to_target: median time until the end of the generation where the target
+          was first reached, over the runs that reached it
+        - fitness_in_budget: mean best fitness reached within the time budget
+        - fitness_per_second: mean best fitness of the last generation divided by the mean run time
+        - run_time: mean time of a run
+
+    Result sets without the elapsed times (e.g. converted from the original results.csv,
+    see results_store.py) are ranked by their fitness only: success_rate,
+    generations_to_target (median number of generations until the target was first
+    reached, over the runs that reached it) and final_fitness (mean best fitness of
+    the last generation).
+
+    Args:
+        target (int, optional): Target fitness. Defaults to 95% of the best fitness found
+            in the Grid Search.
+        time_budget (float, optional): Time budget in seconds. Defaults to the median run time
+            over all combinations.
+        cpu (bool, optional): Use CPU time instead of wall-clock time
+        directory (str, optional): Directory of the result set. Defaults to the result set
+            of the last Grid Search run with this script.
+
+    Returns:
+        ranking (pd.DataFrame): One row per combination, sorted by success rate
+            (descending) and time (or generations) to target (ascending)
+    """
+    results = load_results(directory)
+
+    # Arrays (combinations x runs x generations)
+    fitnesses = np.asarray(results.fitness)
+    times = results.cpu_time if cpu else results.wall_time
+
+    if target is None:
+        target = 0.95 * fitnesses.max()
+
+    if times is None:
+        print(f'{directory} has no {"CPU" if cpu else "wall-clock"} times: ranking by fitness only')
+
+        return _rank_by_fitness(results.combinations, fitnesses, target)
+
+    times = np.asarray(times)
+
+    if time_budget is None:
+        time_budget = np.median(times[:, :, -1])
+
+    # Time at the end of the first generation of each run that reached the target
+    reached = fitnesses >= target
+    success = reached.any(axis = 2)
+    first_time = np.take_along_axis(times, reached.argmax(axis = 2)[:, :, None], axis = 2)[:, :, 0]
+
+    # Median over the runs that reached the target (infinite if none did)
+    time_to_target = np.full(len(results.combinations), np.inf)
+    has_success = success.any(axis = 1)
+    time_to_target[has_success] = np.nanmedian(np.where(success, first_time, np.nan)[has_success], axis = 1)
+
+    # Best fitness of each run among the generations finished within the budget
+    in_budget = np.where(times <= time_budget, fitnesses, 0).max(axis = 2)
+
+    run_time = times[:, :, -1].mean(axis = 1)
+
+    ranking = pd.DataFrame({'combination': results.combinations,
+                            'success_rate': success.mean(axis = 1),
+                            'time_to_target': time_to_target,
+                            'fitness_in_budget': in_budget.mean(axis = 1),
+                            'fitness_per_second': fitnesses[:, :, -1].mean(axis = 1) / run_time,
+                            'run_time': run_time})
+
+    ranking = ranking.sort_values(['success_rate', 'time_to_target'], ascending = [False, True])
+
+    print(f'Target fitness: {target:.0f}, time budget: {time_budget:.2f} s ({"CPU" if cpu else "wall-clock"} time)')
+
+    return ranking.reset_index(drop = True)
+
+def _rank_by_fitness(combinations, fitnesses, target):
+    """
+    Rank the combinations by their fitness only, for result sets without the elapsed
+    times (see analyze_times)
+    """
+    reached = fitnesses >= target
+    success = reached.any(axis = 2)
+
+    # Median number of generations until the target was first reached (infinite if never)
+    generations_to_target = np.full(len(combinations), np.inf)
+    has_success = success.any(axis = 1)
+    generations_to_target[has_success] = np.nanmedian(np.where(success, reached.argmax(axis = 2) + 1, np.nan)[has_success], axis = 1)
+
+    ranking = pd.DataFrame({'combination': combinations,
+                            'success_rate': success.mean(axis = 1),
+                            'generations_to_target': generations_to_target,
+                            'final_fitness': fitnesses[:, :, -1].mean(axis = 1)})
+
+    ranking = ranking.sort_values(['success_rate', 'generations_to_target'], ascending = [False, True])
+
+    print(f'Target fitness: {target:.0f}')
+
+    return ranking.reset_index(drop = True)
+
 
+# ---------------------- Run or analyze the Grid Search ---------------------- #
 
-#  ------------------ Run the Grid Search (NOTE: Uncomment to run) ------------------ #
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Grid Search over crossover, mutation and elitism')
+    parser.add_argument('--analyze', action = 'store_true', help = 'Rank the combinations of saved results by cost')
+    parser.add_argument('--resume', action = 'store_true', help = 'Resume an interrupted Grid Search')
+    parser.add_argument('--target', type = float, default = None, help = 'Target fitness of the analysis')
+    parser.add_argument('--budget', type = float, default = None, help = 'Time budget (seconds) of the analysis')
+    parser.add_argument('--cpu', action = 'store_true', help = 'Analyze CPU time instead of wall-clock time')
+    parser.add_argument('--directory', default = results_directory, help = 'Result set of the analysis')
+    parser.add_argument('--workers', type = int, default = None, help = 'Number of worker processes')
+    args = parser.parse_args()
 
-# grid_search(selection, crossover, mutation, elitism)
\ No newline at end of file
+    if args.analyze:
+        with pd.option_context('display.max_rows', None, 'display.width', None):
+            print(analyze_times(args.target, args.budget, args.cpu, args.directory))
+    else:
+        grid_search(selection, crossover, mutation, elitism, n_workers = args.workers, resume = args.resume)
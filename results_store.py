@@ -0,0 +1,186 @@
+"""
+This file contains the storage of the Grid Search results as dense numeric arrays.
+
+A result set is a directory with one .npy file per field, each of shape
+(combinations x runs x generations):
+    - fitness.npy: Best fitness of each generation
+    - wall_time.npy, cpu_time.npy (optional): Time elapsed since the start of the
+      run at the end of each generation, in seconds
+and a metadata.json file with the names of the combinations (in the order of the
+first axis) and any other metadata of the Grid Search.
+
+Arrays are memory-mapped when loaded, so large result sets are opened instantly
+and only the parts used are read from disk.
+
+Usage (from the project root):
+    python results_store.py convert results/results.csv results/grid_search
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+FIELDS = ('fitness', 'wall_time', 'cpu_time')
+
+
+class Results:
+    """
+    Result set of a Grid Search (see load_results)
+    """
+    def __init__(self, combinations, arrays, metadata = None):
+        """
+        Args:
+            combinations (list of str): Names of the combinations, in the order of the first axis
+            arrays (dict): Array (combinations x runs x generations) of each field
+            metadata (dict, optional): Other metadata of the Grid Search
+        """
+        self.combinations = list(combinations)
+
+        self.arrays = arrays
+
+        self.metadata = metadata if metadata is not None else {}
+
+        self._index = {combination: idx for idx, combination in enumerate(self.combinations)}
+
+    @property
+    def fitness(self):
+        return self.arrays['fitness']
+
+    @property
+    def wall_time(self):
+        return self.arrays.get('wall_time')
+
+    @property
+    def cpu_time(self):
+        return self.arrays.get('cpu_time')
+
+    @property
+    def shape(self):
+        """
+        (combinations, runs, generations)
+        """
+        return self.fitness.shape
+
+    def get(self, combination, field = 'fitness'):
+        """
+        Values of a combination
+
+        Returns:
+            (np.ndarray): Array of shape (runs x generations)
+        """
+        return self.arrays[field][self._index[combination]]
+
+    def to_frame(self, field = 'fitness'):
+        """
+        Values of a field in the layout of the original results.csv: a DataFrame with
+        the combinations as columns and the generations as rows, where each cell is the
+        list of the values of the runs
+        """
+        import pandas as pd
+
+        values = np.asarray(self.arrays[field])
+
+        return pd.DataFrame({combination: values[idx].T.tolist()
+                             for idx, combination in enumerate(self.combinations)})
+
+
+def save_results(directory, combinations, fitness, wall_time = None, cpu_time = None, **metadata):
+    """
+    Save a result set
+
+    Args:
+        directory (str): Directory of the result set (created if needed)
+        combinations (list of str): Names of the combinations
+        fitness (array-like): Best fitness of each combination, run and generation
+        wall_time, cpu_time (array-like, optional): Elapsed time of each combination, run and generation
+        metadata: Other metadata of the Grid Search (JSON serializable)
+    """
+    os.makedirs(directory, exist_ok = True)
+
+    arrays = {'fitness': np.asarray(fitness, dtype = np.int64)}
+
+    for field, values in (('wall_time', wall_time), ('cpu_time', cpu_time)):
+        if values is not None:
+            arrays[field] = np.asarray(values, dtype = np.float64)
+
+    for field, values in arrays.items():
+        if values.shape != arrays['fitness'].shape or values.shape[0] != len(combinations):
+            raise ValueError(f'{field} must have shape (combinations x runs x generations)')
+
+    # Write each file to a temporary file and rename it, so a result set is never partially written
+    for field in FIELDS:
+        path = os.path.join(directory, f'{field}.npy')
+
+        if field in arrays:
+            temporary_path = f'{path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'wb') as file:
+                np.save(file, arrays[field])
+            os.replace(temporary_path, path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    metadata = dict(metadata, combinations = list(combinations), fields = list(arrays))
+
+    path = os.path.join(directory, 'metadata.json')
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(metadata, file, indent = 2)
+    os.replace(temporary_path, path)
+
+def load_results(directory, mmap = True):
+    """
+    Load a result set
+
+    Args:
+        directory (str): Directory of the result set
+        mmap (bool, optional): Memory-map the arrays (read-only) instead of reading them
+
+    Returns:
+        (Results): Result set
+    """
+    with open(os.path.join(directory, 'metadata.json')) as file:
+        metadata = json.load(file)
+
+    combinations = metadata.pop('combinations')
+
+    arrays = {field: np.load(os.path.join(directory, f'{field}.npy'), mmap_mode = 'r' if mmap else None)
+              for field in metadata.pop('fields')}
+
+    return Results(combinations, arrays, metadata)
+
+def convert_csv(csv_path, directory):
+    """
+    Convert a results file in the original format (each cell of the CSV is a JSON list
+    with the values of the runs) to a result set
+
+    Returns:
+        (Results): Converted result set
+    """
+    import pandas as pd
+
+    results = pd.read_csv(csv_path)
+
+    fitness = np.array([[json.loads(cell) for cell in results[combination]] for combination in results.columns])
+
+    # (combinations x generations x runs) -> (combinations x runs x generations)
+    save_results(directory, list(results.columns), fitness.transpose(0, 2, 1), source = os.path.basename(csv_path))
+
+    return load_results(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Grid Search result sets')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    convert = subparsers.add_parser('convert', help = 'Convert a results CSV to a result set')
+    convert.add_argument('csv_path')
+    convert.add_argument('directory')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        converted = convert_csv(args.csv_path, args.directory)
+        print(f'{len(converted.combinations)} combinations x {converted.shape[1]} runs x '
+              f'{converted.shape[2]} generations saved to {args.directory}')